@@ -0,0 +1,14 @@
+"""Offline benchmarks of the agent's own overhead.
+
+Runs `WebAgent.run` against static fixture pages served locally, with the
+Opper client replaced by scripted answers, so no model calls or live sites
+are involved. Run with `python -m benchmarks.run --help`.
+"""
+
+import sys
+from pathlib import Path
+
+# Make the package importable without installing it, like the examples do
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+sys.path.append(str(root_dir / "src"))
@@ -0,0 +1,139 @@
+"""A stand-in for the Opper client that answers from scripted scenarios after a configurable delay."""
+
+import asyncio
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from opper_webagent.models import Action, Reflection, RelevantInteraction, ScreenOutput
+
+from .scenarios import SCENARIOS, Scenario
+
+_RUN_RE = re.compile(r"\[bench run (\d+)\]")
+_STEP_RE = re.compile(r"\[bench step (\d+)/(\d+)\]")
+
+
+class _Span:
+    async def update(self, **kwargs):
+        pass
+
+
+class _Traces:
+    @asynccontextmanager
+    async def start(self, name: str = None, **kwargs):
+        yield _Span()
+
+
+class _Function:
+    def __init__(self, opper: "FakeOpper", name: str):
+        self._opper = opper
+        self._name = name
+
+    async def chat(self, messages=None, **kwargs):
+        await self._opper._respond_after_latency(self._name)
+        # The vision model points at the middle of the screen
+        return SimpleNamespace(message="Click(50.0, 50.0)")
+
+
+class _Functions:
+    def __init__(self, opper: "FakeOpper"):
+        self._opper = opper
+
+    async def create(self, name: str, instructions: str = None, model: str = None, **kwargs):
+        return _Function(self._opper, name)
+
+
+class FakeOpper:
+    """Answers the agent's model calls from scripted scenarios.
+
+    Every run is registered first, which tags its goal so that reflection
+    and decision calls can be traced back to the run and step they belong
+    to. Each call waits `latency` seconds, or the latency set for its
+    function name in `latencies`, before answering.
+    """
+
+    def __init__(
+        self, base_url: str, latency: float = 0.0, latencies: Optional[Dict[str, float]] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.calls: Counter = Counter()
+        self.functions = _Functions(self)
+        self.traces = _Traces()
+        self._scenarios: Dict[int, Scenario] = {}
+        self._progress: Dict[int, int] = {}
+
+        # Every element a scenario clicks, so observations offer them for speculative grounding
+        self._interactions = [
+            RelevantInteraction(type="click", label=step.param, description=step.param)
+            for scenario in SCENARIOS
+            for step in scenario.steps
+            if step.action == "click"
+        ]
+
+    def register(self, run_id: int, scenario: Scenario) -> str:
+        """Register a run of a scenario and get the goal to run the agent with."""
+        self._scenarios[run_id] = scenario
+        self._progress[run_id] = 0
+        return f"{scenario.goal} [bench run {run_id}]"
+
+    async def call(self, name: str, instructions: str = None, input=None, output_type=None, **kwargs):
+        await self._respond_after_latency(name)
+
+        if name == "look_at_page":
+            return ScreenOutput(
+                observation="The Bench Store fixture page.",
+                reflection="The page has loaded.",
+                relevant_page_actions=self._interactions,
+            ), None
+        if name == "reflect_on_progress":
+            return self._reflect(input["goal"]), None
+        if name == "decide_action":
+            return self._decide(input["goal"]), None
+        if name == "bake_response":
+            return {"result": input["raw_response"]}, None
+        if name == "parse_page_content":
+            return " ".join(input["page_content"].split())[:200], None
+        if name == "merge_page_content":
+            return "\n".join(input["extractions"]), None
+        if name == "summarize_trajectory":
+            return "\n".join(filter(None, [input["previous_summary"], *input["steps"]]))[-2000:], None
+        raise ValueError(f"The benchmark has no scripted answer for {name}")
+
+    def _reflect(self, goal: str) -> Reflection:
+        run_id = int(_RUN_RE.search(goal).group(1))
+        scenario = self._scenarios[run_id]
+        step = self._progress[run_id]
+        if step >= len(scenario.steps):
+            return Reflection(
+                observation="The goal has been met.",
+                reflection="Everything needed has been collected.",
+                decision="finished",
+                param=scenario.answer,
+            )
+        self._progress[run_id] += 1
+        return Reflection(
+            observation="Working towards the goal.",
+            reflection="There is more to do.",
+            decision="continue",
+            param=f"{scenario.steps[step].subgoal} [bench step {run_id}/{step}]",
+        )
+
+    def _decide(self, subgoal: str) -> Action:
+        run_id, step = map(int, _STEP_RE.search(subgoal).groups())
+        scripted = self._scenarios[run_id].steps[step]
+        return Action(
+            thoughts="Following the script.",
+            action=scripted.action,
+            action_goal=scripted.action_goal or scripted.subgoal,
+            param=scripted.param.format(base=self.base_url),
+        )
+
+    async def _respond_after_latency(self, name: str):
+        self.calls[name] += 1
+        latency = self.latencies.get(name, self.latency)
+        if latency:
+            await asyncio.sleep(latency)
@@ -0,0 +1,195 @@
+"""Measure agent overhead, throughput, memory and scaling with concurrent runs."""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Dict, List
+
+os.environ.setdefault("OPPER_API_KEY", "benchmark")
+
+from opper_webagent import BrowserPool, WebAgent
+from opper_webagent.ai import set_opper_factory
+from opper_webagent.timing import summarize_durations
+
+from .fake_opper import FakeOpper
+from .scenarios import SCENARIOS
+from .server import serve_fixtures
+
+# Stages whose time is spent waiting on the (stand-in) model, rather than in the agent itself
+MODEL_STAGES = {"observe", "reflect", "decide", "look", "respond"}
+
+RSS_SAMPLE_SECONDS = 0.1
+
+
+def _process_tree_rss(pid: int) -> int:
+    """Get the resident memory in bytes of a process and all of its descendants, from /proc."""
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/statm") as f:
+                resident = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        # The command name may contain spaces, so the fields are read after its closing paren
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+        rss[int(entry)] = resident * page_size
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total
+
+
+class RssSampler:
+    """Track the peak resident memory of this process and its browsers while running."""
+
+    def __init__(self):
+        self.peak = 0
+        self._task = None
+
+    async def __aenter__(self):
+        self.peak = await asyncio.to_thread(_process_tree_rss, os.getpid())
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _sample(self):
+        while True:
+            rss = await asyncio.to_thread(_process_tree_rss, os.getpid())
+            self.peak = max(self.peak, rss)
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+
+def _overhead_seconds(iteration: Dict) -> float:
+    stages = iteration.get("stage_seconds", {})
+    model_seconds = sum(seconds for stage, seconds in stages.items() if stage in MODEL_STAGES)
+    return max(iteration.get("duration_seconds", 0.0) - model_seconds, 0.0)
+
+
+async def run_level(fake: FakeOpper, run_ids, concurrency: int, rounds: int) -> Dict:
+    """Run `concurrency` sessions at a time, `rounds` times over, and measure them."""
+    baseline = await asyncio.to_thread(_process_tree_rss, os.getpid())
+    pool = BrowserPool(size=concurrency, headless=True)
+    await pool.start(warm=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> Dict:
+        scenario = SCENARIOS[index % len(SCENARIOS)]
+        goal = fake.register(next(run_ids), scenario)
+        async with slots:
+            result = await WebAgent(
+                browser_pool=pool, routing_profile="full", look_cache=False
+            ).run(goal)
+        result["scenario"] = scenario
+        return result
+
+    try:
+        async with RssSampler() as rss:
+            started = time.monotonic()
+            results = await asyncio.gather(*(one(i) for i in range(concurrency * rounds)))
+            wall_seconds = time.monotonic() - started
+    finally:
+        await pool.close()
+
+    iterations = [i for result in results for i in result["iterations"]]
+    failed = [r["scenario"].name for r in results if r["result"] != r["scenario"].answer]
+    return {
+        "concurrency": concurrency,
+        "runs": len(results),
+        "failed": failed,
+        "wall_seconds": wall_seconds,
+        "iterations": len(iterations),
+        "iterations_per_second": len(iterations) / wall_seconds if wall_seconds else 0.0,
+        "iteration_seconds": summarize_durations([i["duration_seconds"] for i in iterations]),
+        "overhead_seconds": summarize_durations([_overhead_seconds(i) for i in iterations]),
+        "browser_setup_seconds": summarize_durations(
+            [r["timing"]["browser_setup_seconds"] for r in results]
+        ),
+        "peak_rss_bytes": rss.peak,
+        "peak_rss_per_session_bytes": max(rss.peak - baseline, 0) // concurrency,
+    }
+
+
+def _print_report(levels: List[Dict]):
+    baseline = levels[0]["iterations_per_second"] or 1.0
+    header = (
+        f"{'conc':>4} {'runs':>5} {'iters':>6} {'iter/s':>8} {'scaling':>8} "
+        f"{'iter p50':>9} {'iter p95':>9} {'ovh p50':>8} {'ovh p95':>8} {'MB/sess':>8} {'failed':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        print(
+            f"{level['concurrency']:>4} {level['runs']:>5} {level['iterations']:>6} "
+            f"{level['iterations_per_second']:>8.2f} "
+            f"{level['iterations_per_second'] / baseline:>7.2f}x "
+            f"{level['iteration_seconds']['p50']:>9.3f} {level['iteration_seconds']['p95']:>9.3f} "
+            f"{level['overhead_seconds']['p50']:>8.3f} {level['overhead_seconds']['p95']:>8.3f} "
+            f"{level['peak_rss_per_session_bytes'] / 2**20:>8.1f} {len(level['failed']):>6}"
+        )
+
+
+async def main(args):
+    latencies = dict(
+        (name, float(seconds))
+        for name, seconds in (item.split("=", 1) for item in args.function_latency)
+    )
+    levels = []
+    with serve_fixtures() as base_url:
+        fake = FakeOpper(base_url, latency=args.latency, latencies=latencies)
+        set_opper_factory(lambda: fake)
+        run_ids = itertools.count(1)
+        try:
+            for concurrency in args.concurrency:
+                levels.append(await run_level(fake, run_ids, concurrency, args.rounds))
+        finally:
+            set_opper_factory(None)
+
+    _print_report(levels)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency": args.latency, "levels": levels}, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds each model call takes (default: 0)"
+    )
+    parser.add_argument(
+        "--function-latency",
+        action="append",
+        default=[],
+        metavar="NAME=SECONDS",
+        help="Latency of one function, e.g. reflect_on_progress=1.5 (repeatable)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(c) for c in value.split(",")],
+        default=[1, 2, 4],
+        help="Comma separated numbers of concurrent runs to measure (default: 1,2,4)",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=3, help="Runs per concurrent session (default: 3)"
+    )
+    parser.add_argument("--json", help="Also write the full results to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
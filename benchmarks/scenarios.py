@@ -0,0 +1,60 @@
+"""Scripted agent runs against the local fixture site."""
+
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class Step:
+    """One scripted iteration: the subgoal reflection continues with and the action decided for it."""
+
+    subgoal: str
+    action: str
+    param: str = ""
+    action_goal: str = ""
+
+
+@dataclass
+class Scenario:
+    name: str
+    goal: str
+    steps: List[Step] = field(default_factory=list)
+    answer: str = "Done"
+
+
+SCENARIOS = [
+    Scenario(
+        name="browse",
+        goal="Find the price of Widget 42 in the Bench Store",
+        steps=[
+            Step("Open the store", "navigate", "{base}/index.html"),
+            Step("Accept cookies on the banner", "click", "Accept cookies button"),
+            Step("Open the Products listing", "click", "Products link"),
+            Step("Look further down the listing", "scroll_down", "page"),
+            Step("Read the price of Widget 42", "look", "", "price of Widget 42"),
+        ],
+        answer="Widget 42 costs $52.50",
+    ),
+    Scenario(
+        name="search",
+        goal="Search the Bench Store for widgets and list the results",
+        steps=[
+            Step("Open the search page", "navigate", "{base}/search.html"),
+            Step("Click into the Search products field", "click", "Search products field"),
+            Step("Search for widgets", "type", "widget"),
+            Step("Wait for the results", "wait"),
+            Step("Read the results", "look", "", "search results and their prices"),
+        ],
+        answer="Five widget results from $3.50 to $17.50",
+    ),
+    Scenario(
+        name="about",
+        goal="Find the support hours of the Bench Store",
+        steps=[
+            Step("Open the store", "navigate", "{base}/index.html"),
+            Step("Open the About us page", "click", "About us link"),
+            Step("Read the support hours", "look", "", "support opening hours"),
+        ],
+        answer="Monday to Friday, 9:00 to 17:00",
+    ),
+]
@@ -4,12 +4,12 @@ import json
 import os
 import sys
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Optional
+from typing import Dict, Optional, Set
 
-from fastapi import BackgroundTasks, FastAPI, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import BackgroundTasks, FastAPI, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
@@ -18,14 +18,51 @@ root_dir = Path(__file__).parent.parent.parent
 sys.path.append(str(root_dir))
 sys.path.append(str(root_dir / "src"))
 
-from opper_webagent import WebAgent
+from opper_webagent import BrowserPool, QueueFullError, RunScheduler, WebAgent
+from opper_webagent.ai import call_stats, warm_up
 
-app = FastAPI()
+try:
+    from . import metrics
+    from .backends import create_backend
+except ImportError:
+    import metrics
+    from backends import create_backend
+
+# Browsers are shared between sessions handled by this worker
+browser_pool = BrowserPool()
+
+# Runs beyond the pool size wait their turn, by priority and fairly between tenants;
+# WEBAGENT_MAX_MODEL_CALLS also caps the model calls in flight across all runs
+scheduler = RunScheduler(
+    max_concurrent_runs=int(os.getenv("WEBAGENT_MAX_RUNS", browser_pool.size)),
+    max_queued=int(os.getenv("WEBAGENT_MAX_QUEUED", "100")),
+)
+
+# Status events, results and stop requests of sessions, shared between workers
+# as set by WEBAGENT_SESSION_BACKEND (in this process only by default)
+sessions = create_backend()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.gather(browser_pool.start(warm=1), warm_up(), sessions.start())
+    yield
+    await browser_pool.close()
+    await sessions.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 templates = Jinja2Templates(directory="examples/rest/templates")
 
-# Store active sessions and their status
-status_queues: Dict[str, Queue] = {}
+# Comment sent on idle streams so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+
+# Longest side of the thumbnails sent inline with new screenshots, 0 to only send a link
+THUMBNAIL_EDGE = int(os.getenv("WEBAGENT_STATUS_THUMBNAIL_EDGE", "0"))
+
+# Ids of the screenshots already stored for each session run by this worker
+sent_screenshots: Dict[str, Set[str]] = {}
 
 # Default response schema
 DEFAULT_SCHEMA = {
@@ -51,74 +88,110 @@ class RunRequest(BaseModel):
     secrets: Optional[str] = None
     responseSchema: Optional[dict] = None
     max_iterations: Optional[int] = None
+    # Lower numbers start first when runs are queued
+    priority: int = 0
+    tenant: Optional[str] = None
 
 
 def status_callback(
-    action: str, details: str, screenshot_path: str = None, session_id: str = None
+    action: str, details: str, screenshot=None, session_id: str = None
 ):
     """Callback function to receive status updates from the agent"""
-    print(f"{session_id}: {action}, {details}, {screenshot_path}")
+    print(f"{session_id}: {action}, {details}")
 
-    # Convert screenshot to base64 if available
-    screenshot_data = None
-    if screenshot_path and os.path.isfile(screenshot_path):
-        with open(screenshot_path, "rb") as f:
-            screenshot_data = base64.b64encode(f.read()).decode("utf-8")
+    if not session_id:
+        return
 
     status_update = {
         "action": action,
         "details": details,
-        "screenshot_data": screenshot_data,
+        "screenshot": _screenshot_reference(session_id, screenshot) if screenshot else None,
     }
+    sessions.publish(session_id, status_update)
 
-    if session_id:
-        status_queues[session_id].put(status_update)
-
-
-async def status_stream_generator(session_id: str):
-    """Generate status stream events"""
-    if session_id not in status_queues:
-        return
 
-    queue = status_queues[session_id]
-    while True:
-        try:
-            if not queue.empty():
-                status = queue.get()
-                yield f"data: {json.dumps(status)}\n\n".encode("utf-8")
-                if status.get("action") in ["completed", "error"]:
-                    break
-            else:
-                # Send keep-alive every second if no updates
-                await asyncio.sleep(1)
+def _screenshot_reference(session_id: str, screenshot) -> dict:
+    """Refer to a screenshot by content id, storing it the first time the session shows it"""
+    screenshot_id = screenshot.content_id
+    reference = {
+        "id": screenshot_id,
+        "url": f"/screenshots/{session_id}/{screenshot_id}",
+        "width": screenshot.width,
+        "height": screenshot.height,
+    }
+    sent = sent_screenshots.setdefault(session_id, set())
+    if screenshot_id not in sent:
+        sent.add(screenshot_id)
+        sessions.save_screenshot(session_id, screenshot_id, screenshot.mime_type, screenshot.data)
+        if THUMBNAIL_EDGE:
+            thumbnail = base64.b64encode(screenshot.thumbnail(THUMBNAIL_EDGE)).decode("utf-8")
+            reference["thumbnail"] = f"data:image/jpeg;base64,{thumbnail}"
+    return reference
+
+
+async def status_stream_generator(session_id: str, last_event_id: Optional[str] = None):
+    """Generate status stream events as soon as they are published"""
+    try:
+        async for event_id, status in sessions.subscribe(
+            session_id, last_event_id, keepalive_seconds=KEEPALIVE_SECONDS
+        ):
+            if event_id is None:
                 yield ": keep-alive\n\n"
-                # yield b'data: {"action": null, "details": null}\n\n'
-
-        except Exception as e:
-            print(f"error in status stream: {str(e)}")
-            break
+                continue
+            yield f"id: {event_id}\ndata: {json.dumps(status)}\n\n".encode("utf-8")
+    except Exception as e:
+        print(f"error in status stream: {str(e)}")
 
 
 @app.get("/status-stream/{session_id}")
-async def status_stream(session_id: str):
-    """SSE endpoint for streaming status updates"""
+async def status_stream(session_id: str, last_event_id: Optional[str] = Header(None)):
+    """SSE endpoint for streaming status updates, resuming after `Last-Event-ID` when given"""
+    if not await sessions.exists(session_id):
+        return JSONResponse({"error": "Unknown session"}, status_code=404)
     return StreamingResponse(
-        status_stream_generator(session_id), media_type="text/event-stream"
+        status_stream_generator(session_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/screenshots/{session_id}/{screenshot_id}")
+async def get_screenshot(session_id: str, screenshot_id: str):
+    """Full resolution screenshot referenced by a status update"""
+    screenshot = await sessions.get_screenshot(session_id, screenshot_id)
+    if screenshot is None:
+        return JSONResponse({"error": "Unknown screenshot"}, status_code=404)
+    mime_type, data = screenshot
+    # Ids are derived from the content, so a screenshot never changes
+    return Response(
+        data, media_type=mime_type, headers={"Cache-Control": "private, max-age=3600, immutable"}
     )
 
 
-@app.patch("/stop/{session_id}")
+@app.api_route("/stop/{session_id}", methods=["PATCH", "POST"])
 async def stop_agent(session_id: str):
-    """Stop an agent session"""
-    if session_id and session_id in status_queues:
-        status_queues.pop(session_id, None)
-    return JSONResponse({"status": "stopped"})
+    """Stop an agent session, whichever worker is running it"""
+    if not await sessions.exists(session_id):
+        return JSONResponse({"error": "Unknown session"}, status_code=404)
+    await sessions.request_stop(session_id)
+    return JSONResponse({"status": "stopping"})
+
+
+@app.get("/result/{session_id}")
+async def get_result(session_id: str):
+    """Get the result of a session, once it has finished"""
+    session = await sessions.get_session(session_id)
+    if session is None:
+        return JSONResponse({"error": "Unknown session"}, status_code=404)
+    return JSONResponse(
+        {"status": "finished" if session["finished"] else "running", "result": session["result"]}
+    )
 
 
 # Create a session-specific callback
 def _get_session_callback(session_id: str):
-    def callback(action, details, screenshot_path=None):
-        status_callback(action, details, screenshot_path, session_id)
+    def callback(action, details, screenshot=None):
+        status_callback(action, details, screenshot, session_id)
 
     return callback
 
@@ -128,38 +201,60 @@ async def _run_agent(session_id: str, request: RunRequest):
     schema = request.responseSchema if request.responseSchema else DEFAULT_SCHEMA
 
     callback = _get_session_callback(session_id)
+    agent = WebAgent(
+        max_iterations=request.max_iterations, browser_pool=browser_pool, scheduler=scheduler
+    )
+
+    async def stop_when_requested():
+        await sessions.wait_for_stop(session_id)
+        agent.stop()
 
+    stop_watcher = asyncio.create_task(stop_when_requested())
+    result = None
     try:
-        result = await WebAgent(max_iterations=request.max_iterations).run(
+        result = await agent.run(
             goal=request.goal,
             secrets=request.secrets,
             response_schema=schema,
             status_callback=callback,
             session_id=session_id,
+            priority=request.priority,
+            tenant=request.tenant,
         )
         print("done")
-        if session_id in status_queues:
-            status_queues[session_id].put(
-                {"action": "completed", "details": "Task completed", "result": result}
-            )
+        metrics.record_run(result)
+        sessions.publish(
+            session_id, {"action": "completed", "details": "Task completed", "result": result}
+        )
         return result
+    except QueueFullError:
+        # The queue filled up between the check in /run and this run reaching the scheduler
+        sessions.publish(
+            session_id, {"action": "rejected", "details": "Too many runs queued, try again later"}
+        )
     except Exception as e:
-        if session_id in status_queues:
-            status_queues[session_id].put(
-                {"action": "error", "details": f"Task failed: {str(e)}"}
-            )
+        sessions.publish(session_id, {"action": "error", "details": f"Task failed: {str(e)}"})
         raise
     finally:
-        status_queues.pop(session_id, None)
+        stop_watcher.cancel()
+        sent_screenshots.pop(session_id, None)
+        sessions.finish(session_id, result)
 
 
 @app.post("/run")
 async def run_agent(request: RunRequest, background_tasks: BackgroundTasks):
     """Start a new agent run"""
+    if scheduler.is_full():
+        return JSONResponse(
+            {"error": "Too many runs queued, try again later"},
+            status_code=429,
+            headers={"Retry-After": "30"},
+        )
+
     # Generate a new session ID
     session_id = str(uuid.uuid4())
 
-    status_queues[session_id] = Queue()
+    await sessions.open(session_id)
 
     background_tasks.add_task(_run_agent, session_id, request)
 
@@ -180,13 +275,37 @@ async def get_agent_info():
                 "scroll_down",
                 "scroll_up",
                 "look",
+                "explore",
                 "wait",
             ],
-            "status": {"active_sessions": len(status_queues), "available": True},
+            "status": {
+                "active_sessions": await sessions.active_sessions(),
+                "available": True,
+                "browser_pool": browser_pool.stats(),
+                "scheduler": scheduler.stats(),
+                "model_calls": call_stats(),
+            },
         }
     )
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Run, iteration and stage duration histograms across sessions, in Prometheus format"""
+    stats = scheduler.stats()
+    gauges = {
+        "webagent_runs_in_progress": ("Runs holding a run slot.", stats["running"]),
+        "webagent_runs_queued": ("Runs waiting for a run slot.", stats["queued"]),
+        "webagent_model_calls_in_flight": (
+            "Model calls sent and awaiting a response.",
+            call_stats()["in_flight"],
+        ),
+    }
+    return PlainTextResponse(
+        metrics.render(gauges), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -0,0 +1,575 @@
+"""Session state shared between the workers of the REST service.
+
+A session's status events, its result and requests to stop it go through a
+`SessionBackend`, so any worker can serve the stream, result or stop of a
+session run by another. Three backends are available, picked with
+`WEBAGENT_SESSION_BACKEND`:
+
+- "memory" (default): in-process only, for a single worker
+- "sqlite:///sessions.db": a SQLite file shared by the workers of one host
+- "redis://host:6379/0": a Redis-compatible store shared across hosts
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+try:
+    from .broker import StatusBroker
+except ImportError:
+    from broker import StatusBroker
+
+# How often stores without push notifications are checked for new events and stop requests
+POLL_SECONDS = 0.1
+STOP_POLL_SECONDS = 0.5
+
+# How long a session that never finished is kept, e.g. when its worker died
+SESSION_TTL_SECONDS = 24 * 3600
+
+# Latest full-resolution screenshots kept per session
+SCREENSHOTS_PER_SESSION = 64
+
+
+class SessionBackend(ABC):
+    """Where the events, result and stop signal of each session are kept.
+
+    `publish` and `finish` may be called from any thread and never block:
+    writes are queued and applied in order by a single task, so a session's
+    events are stored in the order they were published and its stream only
+    ends after the last of them.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._jobs: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._jobs = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write())
+
+    async def aclose(self):
+        if self._writer is None:
+            return
+        await self._jobs.join()
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+
+    @abstractmethod
+    async def open(self, session_id: str):
+        """Start a session."""
+
+    def publish(self, session_id: str, event: dict):
+        """Add a status event to a session."""
+        self._submit(self._append, session_id, event)
+
+    def finish(self, session_id: str, result: Optional[dict] = None):
+        """Store a session's result and end its streams after the events published so far."""
+        self._submit(self._finish, session_id, result)
+
+    def save_screenshot(self, session_id: str, screenshot_id: str, mime_type: str, data: bytes):
+        """Keep a screenshot of a session, to be fetched by id from any worker."""
+        self._submit(self._save_screenshot, session_id, screenshot_id, mime_type, data)
+
+    @abstractmethod
+    async def get_screenshot(
+        self, session_id: str, screenshot_id: str
+    ) -> Optional[Tuple[str, bytes]]:
+        """Get the mime type and data of a session's screenshot, or None if it is not kept."""
+
+    @abstractmethod
+    async def subscribe(
+        self,
+        session_id: str,
+        last_event_id: Optional[str] = None,
+        keepalive_seconds: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[Optional[str], Optional[dict]]]:
+        """Yield `(id, event)` for a session, after `last_event_id` when given.
+
+        `(None, None)` is yielded when `keepalive_seconds` pass without an event.
+        """
+
+    @abstractmethod
+    async def exists(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        """Get whether a session has finished and its result, or None for an unknown session."""
+
+    @abstractmethod
+    async def request_stop(self, session_id: str):
+        ...
+
+    @abstractmethod
+    async def wait_for_stop(self, session_id: str):
+        """Return once a stop has been requested for a session, from any worker."""
+
+    @abstractmethod
+    async def active_sessions(self) -> int:
+        ...
+
+    @abstractmethod
+    async def _append(self, session_id: str, event: dict):
+        ...
+
+    @abstractmethod
+    async def _finish(self, session_id: str, result: Optional[dict]):
+        ...
+
+    @abstractmethod
+    async def _save_screenshot(
+        self, session_id: str, screenshot_id: str, mime_type: str, data: bytes
+    ):
+        ...
+
+    def _submit(self, write, *args):
+        if self._loop is None:
+            raise RuntimeError("The session backend has not been started")
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._jobs.put_nowait((write, args))
+        else:
+            self._loop.call_soon_threadsafe(self._jobs.put_nowait, (write, args))
+
+    async def _write(self):
+        while True:
+            write, args = await self._jobs.get()
+            try:
+                await write(*args)
+            except Exception as e:
+                logging.error(f"Failed to write session state: {str(e)}")
+            finally:
+                self._jobs.task_done()
+
+
+class InProcessBackend(SessionBackend):
+    """Sessions kept in this process, for a service running a single worker."""
+
+    def __init__(self, history: int = 256, buffer: int = 64, retention_seconds: float = 60):
+        super().__init__()
+        self.retention_seconds = retention_seconds
+        self._broker = StatusBroker(history, buffer, retention_seconds)
+        self._sessions: Dict[str, Dict] = {}
+        self._stops: Dict[str, asyncio.Event] = {}
+        self._screenshots: Dict[str, OrderedDict] = {}
+
+    async def open(self, session_id: str):
+        self._broker.open(session_id)
+        self._sessions[session_id] = {"finished": False, "result": None}
+        self._stops[session_id] = asyncio.Event()
+        self._screenshots[session_id] = OrderedDict()
+
+    def publish(self, session_id: str, event: dict):
+        # The broker is already ordered and safe to call from any thread
+        self._broker.publish(session_id, event)
+
+    async def _append(self, session_id: str, event: dict):
+        self._broker.publish(session_id, event)
+
+    async def _finish(self, session_id: str, result: Optional[dict]):
+        session = self._sessions.get(session_id)
+        if session is None or session["finished"]:
+            return
+        session.update(finished=True, result=result)
+        self._broker.close(session_id)
+        self._loop.call_later(self.retention_seconds, self._forget, session_id)
+
+    def _forget(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._stops.pop(session_id, None)
+        self._screenshots.pop(session_id, None)
+
+    async def _save_screenshot(self, session_id, screenshot_id, mime_type, data):
+        screenshots = self._screenshots.get(session_id)
+        if screenshots is None:
+            return
+        screenshots[screenshot_id] = (mime_type, data)
+        screenshots.move_to_end(screenshot_id)
+        while len(screenshots) > SCREENSHOTS_PER_SESSION:
+            screenshots.popitem(last=False)
+
+    async def get_screenshot(self, session_id, screenshot_id):
+        return self._screenshots.get(session_id, {}).get(screenshot_id)
+
+    async def subscribe(self, session_id, last_event_id=None, keepalive_seconds=None):
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        async for event_id, event in self._broker.subscribe(session_id, after, keepalive_seconds):
+            yield (None if event_id is None else str(event_id)), event
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        session = self._sessions.get(session_id)
+        return dict(session) if session else None
+
+    async def request_stop(self, session_id: str):
+        if session_id in self._stops:
+            self._stops[session_id].set()
+
+    async def wait_for_stop(self, session_id: str):
+        stop = self._stops.get(session_id)
+        if stop is None:
+            # Never returns, like a stop that is never requested
+            stop = asyncio.Event()
+        await stop.wait()
+
+    async def active_sessions(self) -> int:
+        return sum(1 for session in self._sessions.values() if not session["finished"])
+
+
+class SQLiteBackend(SessionBackend):
+    """Sessions in a SQLite file, shared by every worker on the host using the same path.
+
+    SQLite cannot notify other processes of a write, so streams and stop
+    watchers check for changes every `POLL_SECONDS` and `STOP_POLL_SECONDS`.
+    The last `history` events of a session are kept, and finished sessions
+    are removed after `retention_seconds`.
+    """
+
+    def __init__(self, path: str, history: int = 256, retention_seconds: float = 3600):
+        super().__init__()
+        self.path = path
+        self.history = history
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, finished INTEGER NOT NULL DEFAULT 0, "
+            "stop INTEGER NOT NULL DEFAULT 0, result TEXT, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "session_id TEXT NOT NULL, id INTEGER NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS screenshots ("
+            "session_id TEXT NOT NULL, id TEXT NOT NULL, mime_type TEXT NOT NULL, "
+            "data BLOB NOT NULL, stored_at REAL NOT NULL, PRIMARY KEY (session_id, id))"
+        )
+
+    async def aclose(self):
+        await super().aclose()
+        self._db.close()
+
+    def _run(self, statements):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [self._db.execute(sql, params).fetchall() for sql, params in statements]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    async def _execute(self, *statements):
+        return await asyncio.to_thread(self._run, statements)
+
+    async def open(self, session_id: str):
+        now = time.time()
+        await self._execute(
+            (
+                "DELETE FROM events WHERE session_id IN (SELECT id FROM sessions WHERE "
+                "(finished = 1 AND updated_at < ?) OR updated_at < ?)",
+                (now - self.retention_seconds, now - SESSION_TTL_SECONDS),
+            ),
+            (
+                "DELETE FROM screenshots WHERE session_id IN (SELECT id FROM sessions WHERE "
+                "(finished = 1 AND updated_at < ?) OR updated_at < ?)",
+                (now - self.retention_seconds, now - SESSION_TTL_SECONDS),
+            ),
+            (
+                "DELETE FROM sessions WHERE (finished = 1 AND updated_at < ?) OR updated_at < ?",
+                (now - self.retention_seconds, now - SESSION_TTL_SECONDS),
+            ),
+            (
+                "INSERT OR REPLACE INTO sessions (id, updated_at) VALUES (?, ?)",
+                (session_id, now),
+            ),
+        )
+
+    async def _append(self, session_id: str, event: dict):
+        await self._execute(
+            (
+                "INSERT INTO events (session_id, id, data) "
+                "SELECT ?, COALESCE(MAX(id), 0) + 1, ? FROM events WHERE session_id = ?",
+                (session_id, json.dumps(event, default=str), session_id),
+            ),
+            (
+                "DELETE FROM events WHERE session_id = ? AND id <= "
+                "(SELECT MAX(id) FROM events WHERE session_id = ?) - ?",
+                (session_id, session_id, self.history),
+            ),
+        )
+
+    async def _finish(self, session_id: str, result: Optional[dict]):
+        await self._execute(
+            (
+                "UPDATE sessions SET finished = 1, result = ?, updated_at = ? "
+                "WHERE id = ? AND finished = 0",
+                (json.dumps(result, default=str), time.time(), session_id),
+            )
+        )
+
+    async def _save_screenshot(self, session_id, screenshot_id, mime_type, data):
+        await self._execute(
+            (
+                "INSERT OR REPLACE INTO screenshots (session_id, id, mime_type, data, stored_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, screenshot_id, mime_type, data, time.time()),
+            ),
+            (
+                "DELETE FROM screenshots WHERE session_id = ? AND id NOT IN ("
+                "SELECT id FROM screenshots WHERE session_id = ? ORDER BY stored_at DESC LIMIT ?)",
+                (session_id, session_id, SCREENSHOTS_PER_SESSION),
+            ),
+        )
+
+    async def get_screenshot(self, session_id, screenshot_id):
+        (rows,) = await self._execute(
+            (
+                "SELECT mime_type, data FROM screenshots WHERE session_id = ? AND id = ?",
+                (session_id, screenshot_id),
+            )
+        )
+        return (rows[0][0], bytes(rows[0][1])) if rows else None
+
+    async def subscribe(self, session_id, last_event_id=None, keepalive_seconds=None):
+        after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+        last_sent = time.monotonic()
+        while True:
+            # Events and the finished flag are read together, so no event published before the end is missed
+            events, session = await self._execute(
+                (
+                    "SELECT id, data FROM events WHERE session_id = ? AND id > ? ORDER BY id",
+                    (session_id, after),
+                ),
+                ("SELECT finished FROM sessions WHERE id = ?", (session_id,)),
+            )
+            for event_id, data in events:
+                after = event_id
+                yield str(event_id), json.loads(data)
+            if not session or session[0][0]:
+                return
+            if events:
+                last_sent = time.monotonic()
+            elif keepalive_seconds is not None and time.monotonic() - last_sent >= keepalive_seconds:
+                last_sent = time.monotonic()
+                yield None, None
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def exists(self, session_id: str) -> bool:
+        return await self.get_session(session_id) is not None
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        (rows,) = await self._execute(
+            ("SELECT finished, result FROM sessions WHERE id = ?", (session_id,))
+        )
+        if not rows:
+            return None
+        finished, result = rows[0]
+        return {"finished": bool(finished), "result": json.loads(result) if result else None}
+
+    async def request_stop(self, session_id: str):
+        await self._execute(("UPDATE sessions SET stop = 1 WHERE id = ?", (session_id,)))
+
+    async def wait_for_stop(self, session_id: str):
+        while True:
+            (rows,) = await self._execute(
+                ("SELECT stop FROM sessions WHERE id = ?", (session_id,))
+            )
+            if rows and rows[0][0]:
+                return
+            await asyncio.sleep(STOP_POLL_SECONDS)
+
+    async def active_sessions(self) -> int:
+        (rows,) = await self._execute(
+            (
+                "SELECT COUNT(*) FROM sessions WHERE finished = 0 AND updated_at >= ?",
+                (time.time() - SESSION_TTL_SECONDS,),
+            )
+        )
+        return rows[0][0]
+
+
+class RedisBackend(SessionBackend):
+    """Sessions in Redis, or any store speaking its protocol, shared by workers on any host.
+
+    Events are kept in a stream per session, trimmed to about `history`
+    entries, so streams are pushed new events with a blocking read rather
+    than polling. Finished sessions expire after `retention_seconds`.
+    Pass a URL, or a `redis.asyncio` compatible client to use a local
+    stand-in instead of a server.
+    """
+
+    def __init__(
+        self,
+        client,
+        history: int = 256,
+        retention_seconds: float = 3600,
+        prefix: str = "webagent",
+    ):
+        super().__init__()
+        if isinstance(client, str):
+            if aioredis is None:
+                raise ImportError(
+                    "The Redis session backend needs the redis package: pip install redis"
+                )
+            client = aioredis.from_url(client, decode_responses=True)
+        self._client = client
+        self.history = history
+        self.retention_seconds = retention_seconds
+        self.prefix = prefix
+
+    async def aclose(self):
+        await super().aclose()
+        await self._client.aclose()
+
+    def _key(self, session_id: str, kind: str = "") -> str:
+        return f"{self.prefix}:session:{session_id}{':' + kind if kind else ''}"
+
+    async def open(self, session_id: str):
+        meta = self._key(session_id)
+        pipe = self._client.pipeline()
+        pipe.delete(
+            meta,
+            self._key(session_id, "events"),
+            self._key(session_id, "stop"),
+            self._key(session_id, "screenshots"),
+            self._key(session_id, "screenshot_ids"),
+        )
+        pipe.hset(meta, mapping={"finished": 0, "stop": 0})
+        pipe.expire(meta, SESSION_TTL_SECONDS)
+        pipe.sadd(f"{self.prefix}:active", session_id)
+        await pipe.execute()
+
+    async def _append(self, session_id: str, event: dict):
+        events = self._key(session_id, "events")
+        pipe = self._client.pipeline()
+        pipe.xadd(
+            events,
+            {"data": json.dumps(event, default=str)},
+            maxlen=self.history,
+            approximate=True,
+        )
+        pipe.expire(events, SESSION_TTL_SECONDS)
+        await pipe.execute()
+
+    async def _finish(self, session_id: str, result: Optional[dict]):
+        meta, events = self._key(session_id), self._key(session_id, "events")
+        pipe = self._client.pipeline()
+        # The end marker wakes streams blocked on the session right away
+        pipe.xadd(events, {"end": 1}, maxlen=self.history, approximate=True)
+        pipe.hset(meta, mapping={"finished": 1, "result": json.dumps(result, default=str)})
+        pipe.srem(f"{self.prefix}:active", session_id)
+        for kind in ("", "events", "stop", "screenshots", "screenshot_ids"):
+            pipe.expire(self._key(session_id, kind), int(self.retention_seconds))
+        await pipe.execute()
+
+    async def _save_screenshot(self, session_id, screenshot_id, mime_type, data):
+        screenshots = self._key(session_id, "screenshots")
+        ids = self._key(session_id, "screenshot_ids")
+        # Values are text, as the client decodes responses
+        value = f"{mime_type};{base64.b64encode(data).decode('ascii')}"
+        if not await self._client.hsetnx(screenshots, screenshot_id, value):
+            return
+        await self._client.rpush(ids, screenshot_id)
+        dropped = []
+        while await self._client.llen(ids) > SCREENSHOTS_PER_SESSION:
+            dropped.append(await self._client.lpop(ids))
+        pipe = self._client.pipeline()
+        if dropped:
+            pipe.hdel(screenshots, *dropped)
+        pipe.expire(screenshots, SESSION_TTL_SECONDS)
+        pipe.expire(ids, SESSION_TTL_SECONDS)
+        await pipe.execute()
+
+    async def get_screenshot(self, session_id, screenshot_id):
+        value = await self._client.hget(self._key(session_id, "screenshots"), screenshot_id)
+        if value is None:
+            return None
+        mime_type, data = value.split(";", 1)
+        return mime_type, base64.b64decode(data)
+
+    async def subscribe(self, session_id, last_event_id=None, keepalive_seconds=None):
+        events = self._key(session_id, "events")
+        after = last_event_id or "0-0"
+        block = int(keepalive_seconds * 1000) if keepalive_seconds else 0
+        while True:
+            response = await self._client.xread({events: after}, block=block)
+            if not response:
+                if await self._client.hget(self._key(session_id), "finished") != "0":
+                    return
+                yield None, None
+                continue
+            for event_id, fields in response[0][1]:
+                after = event_id
+                if "end" in fields:
+                    return
+                yield event_id, json.loads(fields["data"])
+
+    async def exists(self, session_id: str) -> bool:
+        return bool(await self._client.exists(self._key(session_id)))
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        meta = await self._client.hgetall(self._key(session_id))
+        if not meta:
+            return None
+        result = meta.get("result")
+        return {"finished": meta["finished"] == "1", "result": json.loads(result) if result else None}
+
+    async def request_stop(self, session_id: str):
+        stop = self._key(session_id, "stop")
+        pipe = self._client.pipeline()
+        pipe.hset(self._key(session_id), "stop", 1)
+        pipe.rpush(stop, 1)
+        pipe.expire(stop, SESSION_TTL_SECONDS)
+        await pipe.execute()
+
+    async def wait_for_stop(self, session_id: str):
+        await self._client.blpop([self._key(session_id, "stop")], timeout=0)
+
+    async def active_sessions(self) -> int:
+        return await self._client.scard(f"{self.prefix}:active")
+
+
+def create_backend(spec: Optional[str] = None) -> SessionBackend:
+    """Create the session backend described by `spec`, or by `WEBAGENT_SESSION_BACKEND`."""
+    spec = spec or os.getenv("WEBAGENT_SESSION_BACKEND", "memory")
+    if spec == "memory":
+        return InProcessBackend()
+    if spec.startswith("sqlite:///"):
+        # Like SQLAlchemy URLs: sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteBackend(spec[len("sqlite:///"):])
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(spec)
+    raise ValueError(
+        f"Unknown session backend {spec!r}, expected memory, sqlite:///path or redis://host"
+    )
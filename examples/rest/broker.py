@@ -0,0 +1,119 @@
+"""An in-process publish/subscribe broker for session status events."""
+
+import asyncio
+import itertools
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from opper_webagent.status import Subscription
+
+
+class _Channel:
+    def __init__(self, history: int):
+        self.history: deque = deque(maxlen=history)
+        self.ids = itertools.count(1)
+        self.subscribers: Set[Subscription] = set()
+        self.closed = False
+
+
+class StatusBroker:
+    """Fans the status events of each session out to any number of subscribers.
+
+    Every event gets an id that increases within its session. The last
+    `history` events are kept, so a client reconnecting with the id of the
+    last event it saw gets what it missed. Each subscriber has a buffer of
+    `buffer` events; when a client falls behind, its oldest events are
+    dropped. A closed session is kept for `retention_seconds` so late
+    subscribers can still replay it.
+    """
+
+    def __init__(self, history: int = 256, buffer: int = 64, retention_seconds: float = 60):
+        self.history = history
+        self.buffer = buffer
+        self.retention_seconds = retention_seconds
+        self._channels: Dict[str, _Channel] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def open(self, session_id: str):
+        """Start accepting events for a session."""
+        self._loop = asyncio.get_running_loop()
+        self._channels[session_id] = _Channel(self.history)
+
+    def has(self, session_id: str) -> bool:
+        return session_id in self._channels
+
+    def active_sessions(self) -> int:
+        return sum(1 for channel in self._channels.values() if not channel.closed)
+
+    def publish(self, session_id: str, data: dict):
+        """Publish an event to every subscriber of a session. Safe to call from any thread."""
+        if self._in_loop():
+            self._publish(session_id, data)
+        elif self._loop:
+            self._loop.call_soon_threadsafe(self._publish, session_id, data)
+
+    def close(self, session_id: str):
+        """End a session's stream once subscribers have received what was published."""
+        if self._in_loop():
+            self._close(session_id)
+        elif self._loop:
+            self._loop.call_soon_threadsafe(self._close, session_id)
+
+    async def subscribe(
+        self,
+        session_id: str,
+        last_event_id: Optional[int] = None,
+        keepalive_seconds: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[Optional[int], Optional[dict]]]:
+        """Yield `(id, event)` for a session, starting after `last_event_id` when given.
+
+        Without a `last_event_id`, the session's retained history is
+        replayed first. When `keepalive_seconds` pass without an event,
+        `(None, None)` is yielded so the caller can keep the connection open.
+        """
+        channel = self._channels.get(session_id)
+        if channel is None:
+            return
+
+        subscription = Subscription(self.buffer)
+        for event in channel.history:
+            if last_event_id is None or event[0] > last_event_id:
+                subscription.push(event)
+        channel.subscribers.add(subscription)
+        try:
+            while True:
+                while subscription.items:
+                    yield subscription.items.popleft()
+                if channel.closed:
+                    return
+                subscription.ready.clear()
+                try:
+                    await asyncio.wait_for(subscription.ready.wait(), keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield None, None
+        finally:
+            channel.subscribers.discard(subscription)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _publish(self, session_id: str, data: dict):
+        channel = self._channels.get(session_id)
+        if channel is None or channel.closed:
+            return
+        event = (next(channel.ids), data)
+        channel.history.append(event)
+        for subscription in channel.subscribers:
+            subscription.push(event)
+
+    def _close(self, session_id: str):
+        channel = self._channels.get(session_id)
+        if channel is None or channel.closed:
+            return
+        channel.closed = True
+        for subscription in channel.subscribers:
+            subscription.ready.set()
+        self._loop.call_later(self.retention_seconds, self._channels.pop, session_id, None)
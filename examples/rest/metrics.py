@@ -0,0 +1,80 @@
+"""Prometheus metrics for agent runs, rendered in the text exposition format."""
+
+import bisect
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label value."""
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._series: Dict[str, Tuple[list, list]] = {}
+
+    def observe(self, value: float, label_value: str = ""):
+        with self._lock:
+            counts, totals = self._series.setdefault(
+                label_value, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, totals) in sorted(self._series.items()):
+                labels = f'{self.label}="{label_value}"' if self.label else ""
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                    lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {totals[0]}")
+                lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+
+run_seconds = Histogram("webagent_run_seconds", "Duration of agent runs.")
+iteration_seconds = Histogram(
+    "webagent_iteration_seconds", "Duration of agent loop iterations.",
+    buckets=(0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60),
+)
+stage_seconds = Histogram(
+    "webagent_stage_seconds", "Duration of the stages of agent iterations.", label="stage"
+)
+admission_wait_seconds = Histogram(
+    "webagent_admission_wait_seconds", "Time runs waited in the queue before starting."
+)
+
+
+def record_run(result: dict):
+    """Record the timings of a finished run."""
+    run_seconds.observe(result.get("duration_seconds", 0.0))
+    for iteration in result.get("iterations", []):
+        if "duration_seconds" in iteration:
+            iteration_seconds.observe(iteration["duration_seconds"])
+        for stage, seconds in iteration.get("stage_seconds", {}).items():
+            stage_seconds.observe(seconds, stage)
+    if "admission" in result:
+        admission_wait_seconds.observe(result["admission"]["wait_seconds"])
+
+
+def _gauge(name: str, help: str, value: float) -> str:
+    return f"# HELP {name} {help}\n# TYPE {name} gauge\n{name} {value}"
+
+
+def render(gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    """Render the histograms, and current values given as `{name: (help, value)}`."""
+    histograms = (run_seconds, iteration_seconds, stage_seconds, admission_wait_seconds)
+    parts = [h.render() for h in histograms]
+    parts += [_gauge(name, help, value) for name, (help, value) in (gauges or {}).items()]
+    return "\n".join(parts) + "\n"
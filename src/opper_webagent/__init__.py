@@ -6,8 +6,13 @@ from .ai import (
     reflect_on_progress,
 )
 from .browser.interaction import click_at_coordinates, draw_click_dot, take_screenshot
+from .browser.pool import BrowserPool
+from .browser.screenshot import Screenshot, ScreenshotEncoding
 from .browser.setup import setup_browser
-from .main import WebAgent
+from .cache import DiskCache, MemoryCache
+from .admission import QueueFullError, RunScheduler
+from .macros import MacroStore
+from .main import BatchGoal, WebAgent
 from .models.schemas import (
     Action,
     ActionResult,
@@ -23,6 +28,14 @@ __all__ = [
     "ScreenOutput",
     "RelevantInteraction",
     "setup_browser",
+    "BrowserPool",
+    "Screenshot",
+    "ScreenshotEncoding",
+    "MemoryCache",
+    "DiskCache",
+    "MacroStore",
+    "RunScheduler",
+    "QueueFullError",
     "click_at_coordinates",
     "take_screenshot",
     "draw_click_dot",
@@ -36,4 +49,5 @@ __all__ = [
     "get_status",
     "stop",
     "WebAgent",
+    "BatchGoal",
 ]
@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from .timing import summarize_durations
+
+DEFAULT_TENANT = "default"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a run is refused because too many runs are already queued."""
+
+
+@dataclass
+class Ticket:
+    """A run's place in the scheduler: who it is for, its priority and how long it waited."""
+
+    tenant: str
+    priority: int
+    queued_at: float
+    wait_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        del data["queued_at"]
+        return data
+
+
+@dataclass
+class _Waiter:
+    ticket: Ticket
+    order: int
+    admitted: asyncio.Future
+
+
+class RunScheduler:
+    """Admits at most `max_concurrent_runs` runs at a time and queues the rest.
+
+    Each run holds a browser and runs its own model loop, so this bounds
+    both the browsers and the model loops of a burst. Queued runs are
+    admitted by priority, lower numbers first. Among runs of the same
+    priority, the tenant with the fewest runs in progress goes first, so
+    one tenant's burst cannot starve the others; a tenant's own runs are
+    admitted in arrival order. With `max_queued`, runs arriving at a full
+    queue are refused with a QueueFullError instead of waiting.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_runs: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        wait_window: int = 1000,
+    ):
+        self.max_concurrent_runs = max_concurrent_runs or int(os.getenv("WEBAGENT_MAX_RUNS", "4"))
+        self.max_queued = max_queued
+        self._running: Dict[str, int] = {}
+        self._waiting: List[_Waiter] = []
+        self._order = itertools.count()
+        # Wait times of the latest admitted runs
+        self._waits: deque = deque(maxlen=wait_window)
+        self._admitted = 0
+        self._rejected = 0
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    def has_capacity(self) -> bool:
+        """Whether a run arriving now would start right away."""
+        return not self._waiting and self.running < self.max_concurrent_runs
+
+    def is_full(self) -> bool:
+        """Whether a run arriving now would be refused."""
+        return self.max_queued is not None and len(self._waiting) >= self.max_queued
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[str] = None, priority: int = 0):
+        """Wait for a run slot and hold it for the duration of the block."""
+        ticket = await self.acquire(tenant, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, tenant: Optional[str] = None, priority: int = 0) -> Ticket:
+        """Wait until a run may start. Every acquired ticket must be released."""
+        ticket = Ticket(tenant=tenant or DEFAULT_TENANT, priority=priority, queued_at=time.monotonic())
+        if self.has_capacity():
+            self._admit(ticket)
+            return ticket
+        if self.is_full():
+            self._rejected += 1
+            raise QueueFullError(f"{len(self._waiting)} runs are already waiting to start")
+
+        waiter = _Waiter(ticket, next(self._order), asyncio.get_running_loop().create_future())
+        self._waiting.append(waiter)
+        try:
+            await waiter.admitted
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif waiter.admitted.done():
+                # Admitted just as it was cancelled, so the slot is handed on
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Give a run's slot to the next queued run."""
+        self._running[ticket.tenant] -= 1
+        if not self._running[ticket.tenant]:
+            del self._running[ticket.tenant]
+        self._dispatch()
+
+    def stats(self) -> dict:
+        """Get the runs in progress and queued, per tenant, and how long admitted runs waited."""
+        queued_by_tenant: Dict[str, int] = {}
+        for waiter in self._waiting:
+            queued_by_tenant[waiter.ticket.tenant] = queued_by_tenant.get(waiter.ticket.tenant, 0) + 1
+        return {
+            "max_concurrent_runs": self.max_concurrent_runs,
+            "running": self.running,
+            "queued": self.queued,
+            "running_by_tenant": dict(self._running),
+            "queued_by_tenant": queued_by_tenant,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "wait_seconds": summarize_durations(list(self._waits)),
+        }
+
+    def _admit(self, ticket: Ticket):
+        ticket.wait_seconds = time.monotonic() - ticket.queued_at
+        self._running[ticket.tenant] = self._running.get(ticket.tenant, 0) + 1
+        self._waits.append(ticket.wait_seconds)
+        self._admitted += 1
+
+    def _dispatch(self):
+        while self._waiting and self.running < self.max_concurrent_runs:
+            waiter = min(
+                self._waiting,
+                key=lambda w: (w.ticket.priority, self._running.get(w.ticket.tenant, 0), w.order),
+            )
+            self._waiting.remove(waiter)
+            self._admit(waiter.ticket)
+            waiter.admitted.set_result(None)
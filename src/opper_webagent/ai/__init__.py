@@ -3,15 +3,30 @@
 from .observe import get_page_observation
 from .reflect import reflect_on_progress
 from .decide import decide_next_action
-from .parse import look_at_page_content
+from .parse import LookResult, look_at_page, look_at_page_content
 from .response import bake_response
+from .summarize import summarize_trajectory
 from .vision import find_coordinates
+from .client import get_opper, get_function, set_opper_factory, warm_up
+from .calls import ReplayMissError, call_stats, calls_replayable, configure_calls, limit_calls
 
 __all__ = [
     'get_page_observation',
     'reflect_on_progress',
     'decide_next_action',
+    'LookResult',
+    'look_at_page',
     'look_at_page_content',
     'bake_response',
+    'summarize_trajectory',
     'find_coordinates',
+    'get_opper',
+    'get_function',
+    'set_opper_factory',
+    'warm_up',
+    'configure_calls',
+    'call_stats',
+    'calls_replayable',
+    'limit_calls',
+    'ReplayMissError',
 ] 
\ No newline at end of file
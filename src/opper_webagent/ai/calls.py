@@ -0,0 +1,286 @@
+"""Record, replay and cache model calls.
+
+Every model call made by the AI stages goes through `call` or `chat`, which
+in the default "off" mode simply pass it on to Opper. The other modes are:
+
+- "record": make the call and store the request and response
+- "replay": answer only from stored responses, without any network access
+- "cache": reuse the response of an identical earlier call when there is one
+
+Calls are identified by the function name, model, instructions, output
+type and canonicalized input, with images replaced by a hash of their
+content. The mode and store are set with `configure_calls`, or with the
+`WEBAGENT_CALL_MODE` and `WEBAGENT_CALL_STORE` environment variables.
+
+The number of calls sent to Opper at once can be capped with `limit_calls`
+or `WEBAGENT_MAX_MODEL_CALLS`; calls over the limit wait for a free slot.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from pydantic import BaseModel
+
+from .client import get_opper
+from ..browser.screenshot import ScreenshotImageInput
+from ..cache import DiskCache, MemoryCache
+
+MODES = ("off", "record", "replay", "cache")
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode for a call that was never recorded."""
+
+
+@dataclass
+class ChatOutput:
+    message: str
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    hits: int = 0
+    misses: int = 0
+    recorded: int = 0
+    waits: int = 0
+    wait_seconds_total: float = 0.0
+
+
+class _CallLayer:
+    def __init__(self):
+        self.mode = "off"
+        self.store: Union[MemoryCache, DiskCache, None] = None
+        self.stats = CallStats()
+        self._configured = False
+        self.max_in_flight = int(os.getenv("WEBAGENT_MAX_MODEL_CALLS", "0")) or None
+        self.in_flight = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def configure(self, mode: str, store: Union[str, MemoryCache, DiskCache, None]):
+        if mode not in MODES:
+            raise ValueError(f"Unknown call mode {mode!r}, expected one of {', '.join(MODES)}")
+        if isinstance(store, str):
+            # Recordings are kept whole, a cache is bounded
+            store = DiskCache(store, max_entries=10000) if mode == "cache" else DiskCache(
+                store, max_entries=2**62, ttl_seconds=None
+            )
+        if store is None and mode == "cache":
+            store = MemoryCache(max_entries=1024, ttl_seconds=None)
+        if store is None and mode in ("record", "replay"):
+            raise ValueError(f"The {mode} mode needs a store to keep calls in")
+        self.mode = mode
+        self.store = store
+        self.stats = CallStats()
+        self._configured = True
+
+    def ensure_configured(self):
+        if not self._configured:
+            self.configure(
+                os.getenv("WEBAGENT_CALL_MODE", "off"), os.getenv("WEBAGENT_CALL_STORE")
+            )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the `max_in_flight` slots for a call sent to Opper."""
+        if not self.max_in_flight:
+            yield
+            return
+        # A semaphore belongs to one event loop, so each loop gets its own
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._slots_loop = loop
+        started = time.monotonic()
+        if self._slots.locked():
+            self.stats.waits += 1
+        async with self._slots:
+            self.stats.wait_seconds_total += time.monotonic() - started
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+
+_layer = _CallLayer()
+
+
+def configure_calls(
+    mode: str = "off", store: Union[str, MemoryCache, DiskCache, None] = None
+):
+    """Set how model calls are made: "off", "record", "replay" or "cache".
+
+    `store` is a path to a SQLite file or a cache instance. Record and
+    replay need one; cache mode defaults to an in-memory LRU.
+    """
+    _layer.configure(mode, store)
+
+
+def limit_calls(max_in_flight: Optional[int]):
+    """Cap the number of model calls sent to Opper at once, or lift the cap with None."""
+    _layer.max_in_flight = max_in_flight or None
+    _layer._slots_loop = None
+
+
+class _OfflineSpan:
+    async def update(self, **kwargs):
+        pass
+
+
+@asynccontextmanager
+async def start_trace(name: str):
+    """Start an Opper trace span, or a stand-in that records nothing when replaying offline."""
+    _layer.ensure_configured()
+    if _layer.mode == "replay":
+        yield _OfflineSpan()
+        return
+    async with get_opper().traces.start(name=name) as span:
+        yield span
+
+
+def calls_replayable() -> bool:
+    """Whether model calls are recorded, replayed or cached, so their inputs must not vary between runs."""
+    _layer.ensure_configured()
+    return _layer.mode != "off"
+
+
+def call_stats() -> dict:
+    """Get the number of calls made through the call layer and how they were answered."""
+    _layer.ensure_configured()
+    return {
+        "mode": _layer.mode,
+        "max_in_flight": _layer.max_in_flight,
+        "in_flight": _layer.in_flight,
+        **asdict(_layer.stats),
+    }
+
+
+def _image_hash(data_url: str) -> dict:
+    return {"image_sha256": hashlib.sha256(data_url.encode()).hexdigest()}
+
+
+def canonicalize(value: Any) -> Any:
+    """Turn a call input into plain JSON data, with images replaced by their hash."""
+    if isinstance(value, ScreenshotImageInput):
+        return _image_hash(value.data_url)
+    if isinstance(value, BaseModel):
+        return canonicalize(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, str) and value.startswith("data:"):
+        return _image_hash(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _output_name(output_type) -> Any:
+    if isinstance(output_type, type):
+        return output_type.__name__
+    return canonicalize(output_type)
+
+
+def _key(request: dict) -> str:
+    encoded = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _dump(result: Any) -> Any:
+    if isinstance(result, BaseModel):
+        return result.model_dump(mode="json")
+    return result
+
+
+def _load(data: Any, output_type) -> Any:
+    if isinstance(output_type, type) and issubclass(output_type, BaseModel):
+        return output_type.model_validate(data)
+    return data
+
+
+async def _through_layer(request: dict, make_call, output_type=None):
+    _layer.ensure_configured()
+    _layer.stats.calls += 1
+    if _layer.mode == "off":
+        async with _layer.slot():
+            return await make_call()
+
+    key = _key(request)
+    if _layer.mode in ("replay", "cache"):
+        stored = _layer.store.get(key)
+        if stored is not None:
+            _layer.stats.hits += 1
+            return _load(json.loads(stored)["response"], output_type)
+        _layer.stats.misses += 1
+        if _layer.mode == "replay":
+            raise ReplayMissError(f"No recorded response for {request['name']} ({key[:12]})")
+
+    async with _layer.slot():
+        result = await make_call()
+    _layer.store.set(key, json.dumps({"request": request, "response": _dump(result)}))
+    if _layer.mode == "record":
+        _layer.stats.recorded += 1
+    return result
+
+
+async def call(
+    name: str,
+    instructions: str = None,
+    input: Any = None,
+    model: Optional[str] = None,
+    output_type=None,
+    **kwargs,
+):
+    """Make an Opper call through the call layer.
+
+    Returns `(result, response)` like `opper.call`, where the response is
+    None when the result came from the store.
+    """
+    request = {
+        "name": name,
+        "model": model,
+        "instructions": instructions,
+        "output_type": _output_name(output_type),
+        "input": canonicalize(input),
+    }
+    response = None
+
+    async def make_call():
+        nonlocal response
+        result, response = await get_opper().call(
+            name=name,
+            instructions=instructions,
+            input=input,
+            model=model,
+            output_type=output_type,
+            **kwargs,
+        )
+        return result
+
+    result = await _through_layer(request, make_call, output_type)
+    return result, response
+
+
+async def chat(name: str, messages, get_handle: Callable[[], Awaitable]) -> ChatOutput:
+    """Chat with an Opper function through the call layer.
+
+    The function handle is only fetched, by awaiting `get_handle()`, when
+    the call is actually made.
+    """
+    request = {"name": name, "chat": True, "messages": canonicalize(messages)}
+
+    async def make_call():
+        function = await get_handle()
+        output = await function.chat(messages=messages)
+        return output.message
+
+    return ChatOutput(message=await _through_layer(request, make_call))
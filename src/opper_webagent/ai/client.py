@@ -0,0 +1,128 @@
+"""Shared Opper client and memoized function handles.
+
+Every AI stage gets its client from here instead of building its own, so
+all calls made on an event loop share one connection pool. httpx
+connections are bound to the event loop they were opened on, so there is
+one client per loop.
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from typing import Callable, Dict, Optional, Set
+
+import httpx
+from opperai import AsyncClient, AsyncOpper
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpper]" = (
+    weakref.WeakKeyDictionary()
+)
+_functions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+    weakref.WeakKeyDictionary()
+)
+_function_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+    weakref.WeakKeyDictionary()
+)
+_factory: Optional[Callable[[], AsyncOpper]] = None
+# Replaced sessions being closed, referenced until they are
+_closing: Set[asyncio.Task] = set()
+
+
+def _create_client() -> AsyncOpper:
+    """Create an Opper client with a connection pool that outlives the gaps between calls."""
+    client = AsyncClient()
+    session = client.http_client.session
+    client.http_client.session = httpx.AsyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("WEBAGENT_OPPER_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(
+                os.getenv("WEBAGENT_OPPER_MAX_KEEPALIVE", "20")
+            ),
+            # Keep connections open across iterations, which are seconds apart
+            keepalive_expiry=float(os.getenv("WEBAGENT_OPPER_KEEPALIVE_SECONDS", "120")),
+        ),
+        http2=HTTP2,
+    )
+    _discard(session)
+    return AsyncOpper(client=client)
+
+
+def _discard(session: httpx.AsyncClient):
+    """Close the session an Opper client was built with, once it has been replaced."""
+    loop = _loop()
+    if loop is None:
+        asyncio.run(session.aclose())
+        return
+    task = loop.create_task(session.aclose())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def _loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def set_opper_factory(factory: Optional[Callable[[], AsyncOpper]]):
+    """Replace how clients are created, e.g. with a stand-in backend. Pass None to reset."""
+    global _factory
+    _factory = factory
+    _clients.clear()
+    _functions.clear()
+    _function_locks.clear()
+
+
+def get_opper() -> AsyncOpper:
+    """Get the shared Opper client for the running event loop."""
+    loop = _loop()
+    if loop is None:
+        return (_factory or _create_client)()
+
+    client = _clients.get(loop)
+    if client is None:
+        client = (_factory or _create_client)()
+        _clients[loop] = client
+    return client
+
+
+async def get_function(name: str, instructions: str, model: str, **kwargs):
+    """Get a function handle, creating it on the Opper API only once per event loop."""
+    loop = asyncio.get_running_loop()
+    functions = _functions.setdefault(loop, {})
+    if name in functions:
+        return functions[name]
+
+    lock = _function_locks.setdefault(loop, {}).setdefault(name, asyncio.Lock())
+    async with lock:
+        if name not in functions:
+            functions[name] = await get_opper().functions.create(
+                name=name, instructions=instructions, model=model, **kwargs
+            )
+    return functions[name]
+
+
+async def warm_up():
+    """Open a connection to the Opper API and create the function handles ahead of the first call."""
+    from .vision import get_coordinate_function
+
+    client = get_opper()
+    http = getattr(getattr(client.client, "http_client", None), "session", None)
+    try:
+        if isinstance(http, httpx.AsyncClient):
+            await http.head("/")
+        await get_coordinate_function()
+    except Exception as e:
+        logging.warning(f"Failed to warm up the Opper client: {str(e)}")
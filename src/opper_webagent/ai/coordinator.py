@@ -1,14 +1,12 @@
 import logging
 
-from opperai import Opper
 from opperai.types import CallConfiguration, ImageInput
 
 from ..models import Action, Reflection, ScreenOutput
+from .calls import call
 
-opper = Opper()
 
-
-def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False):
+async def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False):
     if trajectory:
         last_action = trajectory[-1]
     else:
@@ -19,7 +17,7 @@ def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False)
     Be very descriptive of how interaction elements are visually represented."""
 
     try:
-        result, _ = opper.call(
+        result, _ = await call(
             name="look_at_page",
             instructions=instruction,
             input=ImageInput.from_path(screenshot_path),
@@ -33,7 +31,7 @@ def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False)
         return "Failed to analyze screenshot"
 
 
-def reflect_on_progress(goal, current_url, trajectory, current_view):
+async def reflect_on_progress(goal, current_url, trajectory, current_view):
     instruction = """Given the goal, the content of the current page and the trajectory of what you have attempted, decide on weather to continue working towards the goal. Once you have fully completed the goal, you can decide to complete the task with finish. If you are repeatedly failing to complete the goal, you can decide to break.
 
     Important:
@@ -43,7 +41,7 @@ def reflect_on_progress(goal, current_url, trajectory, current_view):
     * The finish decision should be used when you have fully met the goal. Provide all the necessary details as params.
     """
 
-    subgoal, _ = opper.call(
+    subgoal, _ = await call(
         name="reflect_on_progress",
         instructions=instruction,
         input={
@@ -59,7 +57,7 @@ def reflect_on_progress(goal, current_url, trajectory, current_view):
     return subgoal
 
 
-def decide_next_action(subgoal, current_url, trajectory, current_view):
+async def decide_next_action(subgoal, current_url, trajectory, current_view):
     instruction = """You are an agent in control of a browser and you are tasked to decide the next action towards a subgoal.
     
     Your task is to decide the next step to take on the page. 
@@ -84,7 +82,7 @@ def decide_next_action(subgoal, current_url, trajectory, current_view):
     * Make sure to click before you type!! 
     * ONLY ISSUE ONE ACTION, for example ONE very specific click not some compound action.
     """
-    action, _ = opper.call(
+    action, _ = await call(
         name="decide_action",
         instructions=instruction,
         input={
@@ -103,7 +101,7 @@ def decide_next_action(subgoal, current_url, trajectory, current_view):
 async def look_at_page_content(page, action_goal):
     try:
         text_content = await page.evaluate("() => document.body.innerText")
-        result, _ = opper.call(
+        result, _ = await call(
             name="parse_page_content",
             instructions="Given a pages text content and a goal, extract the relevant information",
             model="gcp/gemini-1.5-flash-002-eu",
@@ -117,10 +115,10 @@ async def look_at_page_content(page, action_goal):
     return result
 
 
-def bake_response(raw_response: str, response_model):
+async def bake_response(raw_response: str, response_model):
     """Structure and validate a raw response according to a provided schema model."""
     try:
-        result, _ = opper.call(
+        result, _ = await call(
             name="bake_response",
             instructions="Given a raw text response, bake a final response.",
             input={
@@ -1,10 +1,10 @@
-from opperai import Opper
 from opperai.types import CallConfiguration
+from .calls import call
+from ..trajectory import recent_steps
 from ..models import Action
 
-opper = Opper()
 
-def decide_next_action(subgoal, current_url, trajectory, current_view):
+async def decide_next_action(subgoal, current_url, trajectory, current_view):
     """Decide the next action to take based on the current state and subgoal."""
     instruction = """You are an agent in control of a browser and you are tasked to decide the next action towards a subgoal.
     
@@ -22,6 +22,7 @@ def decide_next_action(subgoal, current_url, trajectory, current_view):
     * The type action always follows with an automatic tab and enter press.
     * Use scroll_down or scroll_up actions to navigate vertically on the page. Scroll down is useful for seeing more results, scroll up for seeing filters etc.
     * You can extract text content of the page with the look action.
+    * To collect or compare information across several pages linked from this one, such as the top search results, use the explore action. The param describes the links to open (e.g. "the first 5 product results") and the action_goal what to find on each page. The pages are read in parallel and their findings returned together, without leaving the current page.
     * When you have the answer or have met the goal use the finish action. Add all details that you have of the result of the task to the action params
 
     Continue until you have clearly met the goal. Always accept cookie popups or any other popups before proceeding.
@@ -30,12 +31,12 @@ def decide_next_action(subgoal, current_url, trajectory, current_view):
     * Make sure to click before you type!! 
     * ONLY ISSUE ONE ACTION, for example ONE very specific click not some compound action.
     """
-    action, _ = opper.call(
+    action, _ = await call(
         name="decide_action",
         instructions=instruction,
         input={
             "goal": subgoal,
-            "trajectory": trajectory[-3:],
+            "trajectory": recent_steps(trajectory, 3),
             "current_url": current_url,
             "current_page": current_view,
         },
@@ -1,11 +1,10 @@
-from opperai import Opper
-from opperai.types import CallConfiguration, ImageInput
+from opperai.types import CallConfiguration
+from .calls import call
 from ..models import ScreenOutput
 import logging
 
-opper = Opper()
 
-def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False):
+async def get_page_observation(goal, trajectory, screenshot, debug: bool = False):
     """Get an observation of the current page state from a screenshot."""
     if trajectory: 
         last_action = trajectory[-1]
@@ -17,10 +16,10 @@ def get_page_observation(goal, trajectory, screenshot_path, debug: bool = False)
     Be very descriptive of how interaction elements are visually represented."""
 
     try:
-        result, _ = opper.call(
+        result, _ = await call(
             name="look_at_page",
             instructions=instruction,
-            input=ImageInput.from_path(screenshot_path),
+            input=screenshot.image_input(),
             output_type=ScreenOutput,
             model="anthropic/claude-3.5-sonnet-20241022",
             configuration=CallConfiguration(evaluation={"enabled": False}),
@@ -1,21 +1,152 @@
-from opperai import Opper
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
 from opperai.types import CallConfiguration
 
-opper = Opper()
+from .calls import call
+from ..text import bm25_scores, chunk_text, estimate_tokens
 
+# Pages with at most this much text are sent whole in a single call
+SINGLE_CALL_CHARS = 24000
 
-async def look_at_page_content(page, action_goal):
-    """Extract and analyze relevant information from the page content."""
-    try:
-        text_content = await page.evaluate("() => document.body.innerText")
-        result, _ = opper.call(
-            name="parse_page_content",
-            instructions="Given a pages text content and a goal, extract the relevant information",
-            model="gcp/gemini-1.5-flash-002-eu",
-            input={"goal": action_goal, "page_content": text_content},
-            output_type=str,
-            configuration=CallConfiguration(evaluation={"enabled": False}),
+# Size of the chunks longer pages are split into and ranked by
+CHUNK_CHARS = 2000
+
+# How many calls relevant text may be spread over, each with up to SINGLE_CALL_CHARS of it
+MAX_PARALLEL_CALLS = 4
+
+EXTRACT_INSTRUCTIONS = "Given a pages text content and a goal, extract the relevant information"
+
+
+@dataclass
+class LookResult:
+    """The information extracted from a page, and how much of the page it took."""
+
+    content: str
+    chunks_total: int
+    chunks_kept: int
+    tokens_sent: int
+    calls: int
+
+    def stats(self) -> dict:
+        return {
+            "chunks_total": self.chunks_total,
+            "chunks_kept": self.chunks_kept,
+            "tokens_sent": self.tokens_sent,
+            "calls": self.calls,
+        }
+
+
+async def read_page_text(page) -> str:
+    """Read the visible text content of the page."""
+    return await page.evaluate("() => document.body.innerText")
+
+
+def select_chunks(text: str, action_goal: str) -> Tuple[List[List[str]], int]:
+    """Split page text into chunks and keep those most relevant to the goal.
+
+    Returns the chunks to send, grouped into one batch per call, and the
+    total number of chunks. Chunks are ranked with BM25 against the goal
+    and kept in page order. When nothing on the page matches the goal, the
+    start of the page is kept instead.
+    """
+    chunks = chunk_text(text, CHUNK_CHARS)
+    scores = bm25_scores(action_goal, chunks)
+    ranked = sorted(
+        (i for i, score in enumerate(scores) if score > 0),
+        key=lambda i: scores[i],
+        reverse=True,
+    ) or range(len(chunks))
+
+    budget = SINGLE_CALL_CHARS * MAX_PARALLEL_CALLS
+    kept: List[int] = []
+    for i in ranked:
+        if len(chunks[i]) > budget:
+            break
+        kept.append(i)
+        budget -= len(chunks[i])
+
+    batches: List[List[str]] = [[]]
+    size = 0
+    for i in sorted(kept):
+        if size + len(chunks[i]) > SINGLE_CALL_CHARS and batches[-1]:
+            batches.append([])
+            size = 0
+        batches[-1].append(chunks[i])
+        size += len(chunks[i]) + 2
+    return [b for b in batches if b], len(chunks)
+
+
+async def _extract(action_goal: str, page_content: str) -> str:
+    result, _ = await call(
+        name="parse_page_content",
+        instructions=EXTRACT_INSTRUCTIONS,
+        model="gcp/gemini-1.5-flash-002-eu",
+        input={"goal": action_goal, "page_content": page_content},
+        output_type=str,
+        configuration=CallConfiguration(evaluation={"enabled": False}),
+    )
+    return result
+
+
+async def _merge(action_goal: str, extractions: List[str]) -> str:
+    result, _ = await call(
+        name="merge_page_content",
+        instructions="Given a goal and information extracted from different parts of the same page, combine it into one answer. Keep every relevant detail, drop duplicates and parts that found nothing relevant.",
+        model="gcp/gemini-1.5-flash-002-eu",
+        input={"goal": action_goal, "extractions": extractions},
+        output_type=str,
+        configuration=CallConfiguration(evaluation={"enabled": False}),
+    )
+    return result
+
+
+async def look_at_page(page, action_goal, text_content: Optional[str] = None) -> LookResult:
+    """Extract the information relevant to a goal from the page text.
+
+    Short pages are sent whole. Longer pages are split into chunks ranked
+    against the goal, and only the most relevant are sent, in parallel
+    calls whose results are merged when there is more than fits in one.
+    """
+    if text_content is None:
+        text_content = await read_page_text(page)
+
+    if len(text_content) <= SINGLE_CALL_CHARS:
+        content = await _extract(action_goal, text_content)
+        return LookResult(
+            content=content,
+            chunks_total=1,
+            chunks_kept=1,
+            tokens_sent=estimate_tokens(text_content),
+            calls=1,
         )
+
+    batches, chunks_total = select_chunks(text_content, action_goal)
+    inputs = ["\n\n".join(batch) for batch in batches]
+    extractions = await asyncio.gather(*(_extract(action_goal, text) for text in inputs))
+    tokens_sent = sum(estimate_tokens(text) for text in inputs)
+    content = extractions[0] if extractions else ""
+    if len(extractions) > 1:
+        content = await _merge(action_goal, list(extractions))
+        tokens_sent += sum(estimate_tokens(text) for text in extractions)
+
+    return LookResult(
+        content=content,
+        chunks_total=chunks_total,
+        chunks_kept=sum(len(batch) for batch in batches),
+        tokens_sent=tokens_sent,
+        calls=len(extractions) + (1 if len(extractions) > 1 else 0),
+    )
+
+
+async def look_at_page_content(page, action_goal, text_content: Optional[str] = None):
+    """Extract and analyze relevant information from the page content.
+
+    The page text is read from the page unless it has already been read.
+    """
+    try:
+        result = (await look_at_page(page, action_goal, text_content)).content
     except Exception as e:
         result = f"Looking at page content failed: {str(e)}"
 
@@ -1,10 +1,10 @@
-from opperai import Opper
 from opperai.types import CallConfiguration
+from .calls import call
+from ..trajectory import recent_steps
 from ..models import Reflection
 
-opper = Opper()
 
-def reflect_on_progress(goal, current_url, trajectory):
+async def reflect_on_progress(goal, current_url, trajectory):
     """Reflect on the current progress and decide whether to continue, finish, or break."""
     instruction = """Given the goal, the content of the current page and the trajectory of what you have attempted, decide on weather to continue working towards the goal. Once you have fully completed the goal, you can decide to complete the task with finish. If you are repeatedly failing to complete the goal, you can decide to break.
 
@@ -15,12 +15,12 @@ def reflect_on_progress(goal, current_url, trajectory):
     * The finish decision should be used when you have fully met the goal. Provide all the necessary details as params.
     """
     
-    subgoal, _ = opper.call(
+    subgoal, _ = await call(
         name="reflect_on_progress",
         instructions=instruction,
         input={
             "goal": goal,
-            "trajectory": trajectory[-10:],
+            "trajectory": recent_steps(trajectory, 10),
         },
         model="anthropic/claude-3.5-sonnet-20241022",
         output_type=Reflection,
@@ -1,12 +1,11 @@
-from opperai import Opper
 from opperai.types import CallConfiguration
+from .calls import call
 
-opper = Opper()
 
-def bake_response(raw_response: str, response_model):
+async def bake_response(raw_response: str, response_model):
     """Structure and validate a raw response according to a provided schema model."""
     try:
-        result, _ = opper.call(
+        result, _ = await call(
             name="bake_response",
             instructions="Given a raw text response, bake a final response.",
             input={
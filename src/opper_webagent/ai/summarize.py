@@ -0,0 +1,29 @@
+from typing import Dict, List
+
+from opperai.types import CallConfiguration
+from .calls import call
+from ..trajectory import MAX_SUMMARY_CHARS, describe_step
+
+
+async def summarize_trajectory(summary: str, steps: List[Dict]) -> str:
+    """Roll a batch of trajectory steps into the running summary of a run."""
+    instruction = f"""You are keeping a running summary of what a browser agent has done so far. Given the previous summary and the steps taken since, write an updated summary.
+
+    Important:
+    * Keep every fact the agent has collected towards its goal, such as prices, names, answers and urls.
+    * Keep which pages were visited and which actions failed or led nowhere, so they are not repeated.
+    * Leave out details that no longer matter, like individual scrolls or waits.
+    * Stay under {MAX_SUMMARY_CHARS} characters.
+    """
+    result, _ = await call(
+        name="summarize_trajectory",
+        instructions=instruction,
+        input={
+            "previous_summary": summary,
+            "steps": [describe_step(step, result_chars=None) for step in steps],
+        },
+        model="gcp/gemini-1.5-flash-002-eu",
+        output_type=str,
+        configuration=CallConfiguration(evaluation={"enabled": False}),
+    )
+    return result[:MAX_SUMMARY_CHARS]
@@ -1,19 +1,22 @@
-from opperai import Opper
-from opperai.types import ImageInput, Message, CallConfiguration
-from PIL import Image
+from opperai.types import Message
+from .calls import chat
+from .client import get_function
 import re
-import logging
 
-opper = Opper()
 
-def find_coordinates(image_path: str, input: str, debug: bool = False):
-
-    f = opper.functions.create(
+async def get_coordinate_function():
+    """Get the (memoized) function handle used to locate elements on screenshots."""
+    return await get_function(
         model="opper/molmo-7b-d-0924",
         instructions="given a screenshot, find the coordinates of the object in question",
         name="find_coordinate",
     )
-    output = f.chat(
+
+
+async def find_coordinates(screenshot, input: str, debug: bool = False):
+
+    output = await chat(
+        "find_coordinate",
         messages=[
             Message(
                 role="user",
@@ -27,23 +30,22 @@ def find_coordinates(image_path: str, input: str, debug: bool = False):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": ImageInput.from_path(image_path)._opper_image_input,
+                            "url": screenshot.data_url,
                         },
                     },
                 ],
             ),
         ],
+        get_handle=get_coordinate_function,
     )
 
     match = re.search(r'Click\((\d+\.?\d*),\s*(\d+\.?\d*)\)', output.message)
     if match:
         x_percent, y_percent = map(float, match.groups())
-        
-        with Image.open(image_path) as img:
-            width, height = img.size
-        
-        x_pixel = (x_percent / 100) * width
-        y_pixel = (y_percent / 100) * height
+
+        # Percentages map straight onto the viewport, whatever size the image was sent at
+        x_pixel = (x_percent / 100) * screenshot.viewport_width
+        y_pixel = (y_percent / 100) * screenshot.viewport_height
         
         return x_pixel, y_pixel
     else:
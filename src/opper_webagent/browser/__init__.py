@@ -1,19 +1,44 @@
 """Browser interaction functionality for web agent."""
 
-from .click import click_at_coordinates, draw_click_dot
+from .click import click_at_coordinates, draw_click_dot, remove_click_dots
+from .explore import PageLink, background_tab, collect_links, rank_links
+from .grounding import GroundingMatch, ground_element
 from .navigate import navigate_to_url
-from .screenshot import take_screenshot, set_page_zoom
-from .scroll import scroll_page
+from .screenshot import Screenshot, ScreenshotEncoding, take_screenshot, set_page_zoom
+from .scroll import is_page_scroll, scroll_page, scroll_region, scroll_viewport
+from .settle import PageActivity, SettleResult, wait_for_settle
 from .type import type_text
-from .setup import setup_browser
+from .setup import setup_browser, create_context
+from .pool import BrowserPool
+from .routing import RoutingProfile, RoutingStats, install_routing
 
 __all__ = [
     'click_at_coordinates',
     'draw_click_dot',
+    'remove_click_dots',
+    'PageLink',
+    'background_tab',
+    'collect_links',
+    'rank_links',
+    'GroundingMatch',
+    'ground_element',
     'navigate_to_url',
+    'Screenshot',
+    'ScreenshotEncoding',
     'take_screenshot',
     'set_page_zoom',
     'scroll_page',
+    'scroll_viewport',
+    'scroll_region',
+    'is_page_scroll',
+    'PageActivity',
+    'SettleResult',
+    'wait_for_settle',
     'type_text',
     'setup_browser',
+    'create_context',
+    'BrowserPool',
+    'RoutingProfile',
+    'RoutingStats',
+    'install_routing',
 ] 
\ No newline at end of file
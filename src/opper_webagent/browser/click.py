@@ -26,8 +26,19 @@ async def draw_click_dot(page, x, y):
         dot.style.pointerEvents = 'none';
         dot.style.transform = 'translate(-50%, -50%)';
         dot.style.zIndex = '9999';
+        dot.setAttribute('data-webagent-click-dot', '');
         document.body.appendChild(dot);
         setTimeout(() => dot.remove(), 2500);
     }""",
         [x, y],
     )
+
+
+async def remove_click_dots(page):
+    """Remove the click indicators still on the page, so they don't show in the next screenshot."""
+    try:
+        await page.evaluate(
+            "() => document.querySelectorAll('[data-webagent-click-dot]').forEach((dot) => dot.remove())"
+        )
+    except Exception:
+        pass
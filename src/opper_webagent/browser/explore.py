@@ -0,0 +1,81 @@
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import List
+from urllib.parse import urldefrag
+
+from ..text import bm25_scores, tokenize
+
+# Words that say which or how many links to open rather than what they are about
+LIST_WORDS = {
+    "first", "second", "third", "top", "last", "next", "few", "several", "couple", "some",
+    "all", "each", "every", "one", "two", "three", "four", "five", "six", "seven", "eight",
+    "nine", "ten", "result", "results", "link", "links", "item", "items", "entry", "entries",
+    "listing", "listings", "pages", "open", "read", "explore", "visit", "check", "them",
+    "these", "those", "more", "search",
+}
+
+# Links in the page content, skipping navigation, headers, footers and sidebars
+_LINKS = """() => {
+    const skip = 'nav, header, footer, aside, [role="navigation"], [role="banner"], [role="contentinfo"]';
+    const links = [];
+    for (const a of document.querySelectorAll('a[href]')) {
+        if (!a.href.startsWith('http') || a.closest(skip)) continue;
+        const rect = a.getBoundingClientRect();
+        if (rect.width === 0 || rect.height === 0) continue;
+        const text = (a.innerText || a.getAttribute('aria-label') || a.title || '').trim();
+        if (text) links.push({ url: a.href, text: text.replace(/\\s+/g, ' ').slice(0, 200) });
+    }
+    return links;
+}"""
+
+
+@dataclass
+class PageLink:
+    url: str
+    text: str
+    # Order of the link in the document
+    position: int
+
+
+async def collect_links(page) -> List[PageLink]:
+    """Get the distinct links in the content of a page, in document order, leaving out the page itself."""
+    current = urldefrag(page.url)[0]
+    seen = {current}
+    links = []
+    for link in await page.evaluate(_LINKS):
+        url = urldefrag(link["url"])[0]
+        if url in seen:
+            continue
+        seen.add(url)
+        links.append(PageLink(url=url, text=link["text"], position=len(links)))
+    return links
+
+
+def rank_links(links: List[PageLink], query: str, count: int) -> List[PageLink]:
+    """Pick the `count` links most relevant to a query, earlier links first among equals.
+
+    Words like "first", "top" or "results" only say which links to take,
+    so they are left out of the query. When nothing else is left, as for
+    "the first 5 results", the first links of the page are picked.
+    """
+    query = " ".join(token for token in tokenize(query) if token not in LIST_WORDS)
+    if not query:
+        return links[:count]
+    scores = bm25_scores(query, [f"{link.text} {link.url}" for link in links])
+    ranked = sorted(zip(scores, links), key=lambda item: (-item[0], item[1].position))
+    return [link for _, link in ranked[:count]]
+
+
+@asynccontextmanager
+async def background_tab(context, url: str, timeout: float = 30000):
+    """Open a URL in a new tab of a browser context, and close the tab when done."""
+    tab = await context.new_page()
+    try:
+        await tab.goto(url, timeout=timeout)
+        yield tab
+    finally:
+        try:
+            await tab.close()
+        except Exception as e:
+            logging.error(f"Error closing tab: {str(e)}")
@@ -0,0 +1,207 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from ..text import tokenize
+
+# Words describing where or how an element looks rather than what it says
+DESCRIPTOR_WORDS = {
+    "top", "bottom", "left", "right", "corner", "center", "middle", "upper",
+    "lower", "side", "header", "footer", "icon", "large", "small", "big",
+    "labeled", "labelled", "titled", "named", "called", "text", "says", "saying",
+}
+
+# Role names that can be hinted at in a description, mapped to matching roles
+ROLE_HINTS = {
+    "button": {"button"},
+    "link": {"link"},
+    "field": {"textbox", "combobox", "searchbox"},
+    "input": {"textbox", "combobox", "searchbox"},
+    "box": {"textbox", "combobox", "searchbox", "checkbox"},
+    "checkbox": {"checkbox"},
+    "dropdown": {"combobox", "listbox"},
+    "tab": {"tab"},
+}
+
+# How much lower a second, different match must score for the best one to be unambiguous
+AMBIGUITY_MARGIN = 0.1
+
+_QUOTED_RE = re.compile(r"[\"'‘“]([^\"'’”]{2,})[\"'’”]")
+
+_COLLECT_CANDIDATES = """() => {
+    const selector = 'a[href], button, input, textarea, select, summary, label, [role], [aria-label], [onclick], [tabindex], [contenteditable="true"]';
+    const implicitRole = (el) => {
+        const tag = el.tagName.toLowerCase();
+        if (tag === 'a') return 'link';
+        if (tag === 'button' || tag === 'summary') return 'button';
+        if (tag === 'select') return 'combobox';
+        if (tag === 'textarea') return 'textbox';
+        if (tag === 'input') {
+            const type = (el.getAttribute('type') || 'text').toLowerCase();
+            if (['submit', 'button', 'reset', 'image'].includes(type)) return 'button';
+            if (type === 'checkbox' || type === 'radio') return type;
+            if (type === 'search') return 'searchbox';
+            return 'textbox';
+        }
+        return tag;
+    };
+    const labelledBy = (el) => {
+        const ids = (el.getAttribute('aria-labelledby') || '').split(/\\s+/).filter(Boolean);
+        return ids.map((id) => {
+            const ref = document.getElementById(id);
+            return ref ? ref.innerText : '';
+        }).join(' ');
+    };
+    const fieldLabel = (el) => {
+        if (!el.labels || !el.labels.length) return '';
+        return Array.from(el.labels).map((l) => l.innerText).join(' ');
+    };
+    const width = window.innerWidth;
+    const height = window.innerHeight;
+    const results = [];
+    for (const el of document.querySelectorAll(selector)) {
+        // A label is matched through the field it labels instead
+        if (el.tagName === 'LABEL' && el.control) continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 2 || rect.height < 2) continue;
+        if (rect.bottom <= 0 || rect.right <= 0 || rect.top >= height || rect.left >= width) continue;
+        const style = window.getComputedStyle(el);
+        if (style.visibility === 'hidden' || style.display === 'none' || parseFloat(style.opacity) === 0) continue;
+
+        const x = Math.min(Math.max(rect.left + rect.width / 2, 0), width - 1);
+        const y = Math.min(Math.max(rect.top + rect.height / 2, 0), height - 1);
+        const top = document.elementFromPoint(x, y);
+        if (top && top !== el && !el.contains(top) && !top.contains(el)) continue;
+
+        const img = el.querySelector('img[alt]');
+        results.push({
+            x, y,
+            role: el.getAttribute('role') || implicitRole(el),
+            text: (el.innerText || '').trim().slice(0, 200),
+            aria_label: [el.getAttribute('aria-label') || '', labelledBy(el)].join(' ').trim(),
+            label: fieldLabel(el),
+            placeholder: el.getAttribute('placeholder') || '',
+            title: el.getAttribute('title') || '',
+            alt: el.getAttribute('alt') || (img ? img.getAttribute('alt') : ''),
+            value: ['submit', 'button', 'reset'].includes((el.getAttribute('type') || '').toLowerCase()) ? (el.value || '') : '',
+            name: el.getAttribute('name') || '',
+        });
+    }
+    return {candidates: results, scroll_x: window.scrollX, scroll_y: window.scrollY};
+}"""
+
+_TEXT_FIELDS = ("aria_label", "text", "label", "placeholder", "title", "alt", "value", "name")
+
+
+@dataclass
+class GroundingMatch:
+    """Where to click for an element description.
+
+    `x`/`y` are the point to click, `page_x`/`page_y` the same point in
+    document coordinates, used to draw the click indicator.
+    """
+
+    x: float
+    y: float
+    page_x: float
+    page_y: float
+    confidence: float
+    label: str
+    source: str = "dom"
+
+
+def _description_tokens(description: str) -> List[str]:
+    return [
+        t for t in tokenize(description) if t not in DESCRIPTOR_WORDS and t not in ROLE_HINTS
+    ]
+
+
+def _field_score(description_tokens: set, quoted: List[str], field: str) -> float:
+    normalized = " ".join(tokenize(field, drop_stopwords=False))
+    if not normalized:
+        return 0.0
+    for phrase in quoted:
+        phrase = " ".join(tokenize(phrase, drop_stopwords=False))
+        if phrase and phrase == normalized:
+            return 1.0
+        if phrase and f" {phrase} " in f" {normalized} ":
+            return 0.9
+
+    field_tokens = set(tokenize(field))
+    common = description_tokens & field_tokens
+    if not common:
+        return 0.0
+    precision = len(common) / len(field_tokens)
+    recall = len(common) / len(description_tokens)
+    # F0.5: an element's own label matters more than the extra words in a description
+    return 1.25 * precision * recall / (0.25 * precision + recall)
+
+
+def score_candidate(description: str, candidate: Dict) -> float:
+    """Score how well a DOM candidate matches an element description (0.0 - 1.0)."""
+    description_tokens = set(_description_tokens(description))
+    quoted = _QUOTED_RE.findall(description)
+    if not description_tokens and not quoted:
+        return 0.0
+
+    score = max(
+        _field_score(description_tokens, quoted, candidate.get(field, ""))
+        for field in _TEXT_FIELDS
+    )
+
+    hinted_roles = set()
+    for word in tokenize(description, drop_stopwords=False):
+        hinted_roles |= ROLE_HINTS.get(word, set())
+    if score and hinted_roles:
+        score += 0.1 if candidate.get("role") in hinted_roles else -0.1
+
+    return max(0.0, min(score, 1.0))
+
+
+def _candidate_label(candidate: Dict) -> str:
+    for field in _TEXT_FIELDS:
+        if candidate.get(field):
+            return candidate[field]
+    return ""
+
+
+async def ground_element(page, description: str) -> Optional[GroundingMatch]:
+    """Find the visible element best matching a description in the live DOM.
+
+    Candidates are the interactive elements in the viewport that are not
+    covered by something else, matched on their visible text, aria labels,
+    field labels, placeholder, title, alt text and role.
+    """
+    try:
+        snapshot = await page.evaluate(_COLLECT_CANDIDATES)
+    except Exception as e:
+        logging.debug(f"DOM grounding failed: {str(e)}")
+        return None
+
+    scored = sorted(
+        ((score_candidate(description, c), c) for c in snapshot["candidates"]),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+    if not scored or scored[0][0] == 0:
+        return None
+
+    confidence, best = scored[0]
+    label = _candidate_label(best)
+    for score, other in scored[1:]:
+        if confidence - score >= AMBIGUITY_MARGIN:
+            break
+        # Another element matches about as well, e.g. several "Add to cart" buttons
+        if (other["x"], other["y"]) != (best["x"], best["y"]):
+            confidence -= 0.2
+            break
+
+    return GroundingMatch(
+        x=best["x"],
+        y=best["y"],
+        page_x=best["x"] + snapshot["scroll_x"],
+        page_y=best["y"] + snapshot["scroll_y"],
+        confidence=confidence,
+        label=label,
+    )
@@ -1,7 +1,7 @@
 import logging
-import tempfile
 
 from ..models import ActionResult
+from .screenshot import take_screenshot
 
 
 async def click_at_coordinates(page, x, y):
@@ -12,20 +12,6 @@ async def click_at_coordinates(page, x, y):
         return ActionResult(success=False, error=str(e))
 
 
-async def take_screenshot(page):
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
-            temp_filename = temp_file.name
-
-        await page.screenshot(path=temp_filename, type="png")
-        return (
-            temp_filename,
-            ActionResult(success=True, output=f"Screenshot saved to {temp_filename}"),
-        )
-    except Exception as e:
-        return None, ActionResult(success=False, error=str(e))
-
-
 async def set_page_zoom(page, zoom_factor):
     try:
         await page.evaluate(f"""
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from playwright.async_api import Browser, async_playwright
+
+from .setup import create_context
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    waits: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    launched: int = 0
+    recycled: int = 0
+    expired: int = 0
+
+
+@dataclass
+class _PooledBrowser:
+    browser: Browser
+    uses: int = 0
+    last_used: float = 0.0
+
+
+class BrowserPool:
+    """A pool of pre-launched Chromium instances shared between WebAgent runs.
+
+    Each run gets a fresh, isolated browser context on an already running
+    browser. Browsers are closed after `max_uses` runs or after sitting idle
+    for `idle_timeout` seconds, and at most `size` runs hold a browser at once.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        max_uses: Optional[int] = None,
+        headless: bool = True,
+    ):
+        self.size = size or int(os.getenv("WEBAGENT_BROWSER_POOL_SIZE", "2"))
+        self.idle_timeout = (
+            idle_timeout
+            if idle_timeout is not None
+            else float(os.getenv("WEBAGENT_BROWSER_IDLE_TIMEOUT", "300"))
+        )
+        self.max_uses = max_uses or int(os.getenv("WEBAGENT_BROWSER_MAX_USES", "50"))
+        self.headless = headless
+
+        self._stats = PoolStats()
+        self._idle: List[_PooledBrowser] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._playwright = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        # Set by close, so browsers of sessions still running are closed instead of kept
+        self._closed = False
+
+    async def start(self, warm: int = 0):
+        """Start the pool, optionally pre-launching `warm` browsers."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._playwright is None:
+                self._closed = False
+                # Kept across a restart, as sessions from before close() still release their slots
+                if self._slots is None:
+                    self._slots = asyncio.Semaphore(self.size)
+                self._playwright = await async_playwright().start()
+                if self.idle_timeout > 0:
+                    self._reaper = asyncio.create_task(self._reap_idle())
+
+        for _ in range(min(warm, self.size) - len(self._idle)):
+            self._idle.append(await self._launch())
+
+    async def close(self):
+        """Close every idle browser and stop the pool.
+
+        Browsers still held by sessions are closed as those sessions end.
+        """
+        self._closed = True
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._close_browser(pooled)
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logging.error(f"Error stopping playwright: {str(e)}")
+            self._playwright = None
+
+    def stats(self) -> dict:
+        """Get hit/miss and wait-time statistics for the pool."""
+        return {**asdict(self._stats), "idle": len(self._idle), "size": self.size}
+
+    @asynccontextmanager
+    async def session(self):
+        """Acquire a browser and yield a fresh `(browser, context, page)` for one run."""
+        await self.start()
+
+        started = time.monotonic()
+        if self._slots.locked():
+            self._stats.waits += 1
+        await self._slots.acquire()
+        waited = time.monotonic() - started
+        self._stats.wait_seconds_total += waited
+        self._stats.wait_seconds_max = max(self._stats.wait_seconds_max, waited)
+
+        pooled = None
+        context = None
+        try:
+            pooled = self._take_idle()
+            if pooled:
+                self._stats.hits += 1
+            else:
+                self._stats.misses += 1
+                pooled = await self._launch()
+
+            context, page = await create_context(pooled.browser)
+            yield pooled.browser, context, page
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logging.error(f"Error closing browser context: {str(e)}")
+            if pooled is not None:
+                await self._release(pooled)
+            self._slots.release()
+
+    def _take_idle(self) -> Optional[_PooledBrowser]:
+        while self._idle:
+            pooled = self._idle.pop()
+            if pooled.browser.is_connected():
+                return pooled
+        return None
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._stats.launched += 1
+        return _PooledBrowser(browser=browser, last_used=time.monotonic())
+
+    async def _release(self, pooled: _PooledBrowser):
+        pooled.uses += 1
+        pooled.last_used = time.monotonic()
+        if self._closed:
+            await self._close_browser(pooled)
+        elif pooled.uses >= self.max_uses or not pooled.browser.is_connected():
+            self._stats.recycled += 1
+            await self._close_browser(pooled)
+        else:
+            self._idle.append(pooled)
+
+    async def _close_browser(self, pooled: _PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logging.error(f"Error closing pooled browser: {str(e)}")
+
+    async def _reap_idle(self):
+        """Close browsers that have been idle for longer than `idle_timeout`."""
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            now = time.monotonic()
+            # Taken out of the idle list before closing any, so no session can take one meanwhile
+            expired = [p for p in self._idle if now - p.last_used >= self.idle_timeout]
+            self._idle = [p for p in self._idle if p not in expired]
+            for pooled in expired:
+                self._stats.expired += 1
+                await self._close_browser(pooled)
@@ -0,0 +1,126 @@
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, FrozenSet, Union
+from urllib.parse import urlsplit
+
+# Ad, tracking and analytics hosts, blocked along with their subdomains
+TRACKER_DOMAINS = frozenset({
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com",
+    "google-analytics.com", "googletagmanager.com", "adservice.google.com",
+    "amazon-adsystem.com", "adnxs.com", "adsrvr.org", "criteo.com", "criteo.net",
+    "taboola.com", "outbrain.com", "rubiconproject.com", "pubmatic.com",
+    "moatads.com", "scorecardresearch.com", "quantserve.com", "chartbeat.com",
+    "hotjar.com", "fullstory.com", "clarity.ms", "segment.io", "mixpanel.com",
+    "amplitude.com", "nr-data.net", "bat.bing.com",
+})
+
+
+@dataclass(frozen=True)
+class RoutingProfile:
+    """Which requests a browser context lets through.
+
+    Requests of a blocked resource type, or to a blocked domain or any of
+    its subdomains, are aborted before they are sent.
+    """
+
+    name: str
+    blocked_resource_types: FrozenSet[str] = frozenset()
+    blocked_domains: FrozenSet[str] = frozenset()
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.blocked_resource_types:
+            return True
+        if not self.blocked_domains:
+            return False
+        host = urlsplit(url).hostname or ""
+        while host:
+            if host in self.blocked_domains:
+                return True
+            _, _, host = host.partition(".")
+        return False
+
+
+# Images and stylesheets are always let through, so screenshots look like the real page
+PROFILES = {
+    "full": RoutingProfile("full"),
+    "no-media": RoutingProfile(
+        "no-media",
+        blocked_resource_types=frozenset({"media"}),
+        blocked_domains=TRACKER_DOMAINS,
+    ),
+    "minimal": RoutingProfile(
+        "minimal",
+        blocked_resource_types=frozenset({"media", "font", "texttrack", "manifest", "eventsource", "ping"}),
+        blocked_domains=TRACKER_DOMAINS,
+    ),
+}
+
+
+@dataclass
+class RoutingStats:
+    profile: str
+    requests_allowed: int = 0
+    requests_blocked: int = 0
+    # Response body bytes received, as encoded on the wire. Blocked requests are never
+    # sent, so what they would have cost is unknown and only counted by resource type
+    bytes_allowed: int = 0
+    blocked_by_type: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def get_profile(profile: Union[str, RoutingProfile, None] = None) -> RoutingProfile:
+    """Get a routing profile by name, defaulting to `WEBAGENT_ROUTING_PROFILE` or "no-media"."""
+    if isinstance(profile, RoutingProfile):
+        return profile
+    name = profile or os.getenv("WEBAGENT_ROUTING_PROFILE", "no-media")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown routing profile {name!r}, expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+async def install_routing(
+    context, profile: Union[str, RoutingProfile, None] = None
+) -> RoutingStats:
+    """Block requests on a browser context according to a profile and count what goes through.
+
+    Nothing is intercepted for a profile that blocks nothing, since routing
+    requests turns off the browser's HTTP cache.
+    """
+    profile = get_profile(profile)
+    stats = RoutingStats(profile=profile.name)
+
+    def on_request(request):
+        stats.requests_allowed += 1
+
+    async def on_request_finished(request):
+        # Counts chunked responses too, which have no Content-Length
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        stats.bytes_allowed += max(sizes.get("responseBodySize", 0), 0)
+
+    async def handle(route):
+        request = route.request
+        if profile.blocks(request.resource_type, request.url):
+            stats.requests_blocked += 1
+            stats.blocked_by_type[request.resource_type] = (
+                stats.blocked_by_type.get(request.resource_type, 0) + 1
+            )
+            try:
+                await route.abort("blockedbyclient")
+            except Exception as e:
+                logging.debug(f"Failed to block request: {str(e)}")
+            return
+        stats.requests_allowed += 1
+        await route.fallback()
+
+    if profile.blocked_resource_types or profile.blocked_domains:
+        await context.route("**/*", handle)
+    else:
+        context.on("request", on_request)
+    context.on("requestfinished", on_request_finished)
+    return stats
@@ -1,19 +1,210 @@
+import asyncio
+import base64
+import hashlib
+import io
 import logging
-import tempfile
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Literal, Optional
+
+from opperai.types import ImageInput
+from PIL import Image, ImageChops
+from pydantic import Field, computed_field
 
 from ..models import ActionResult
 
 
-async def take_screenshot(page):
-    """Take a screenshot of the current page state."""
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as temp_file:
-            temp_filename = temp_file.name
+# Thumbnail size and per-pixel gray level tolerance used to compare screenshots
+FINGERPRINT_SIZE = (320, 180)
+FINGERPRINT_TOLERANCE = 12
+
+
+class ScreenshotImageInput(ImageInput):
+    """An opper image input backed by an already encoded data URL instead of a file"""
+
+    data_url: str = Field(exclude=True)
+
+    @computed_field
+    @property
+    def _opper_image_input(self) -> str:
+        return self.data_url
+
+
+@dataclass
+class ScreenshotEncoding:
+    """How screenshots are encoded before being sent to the vision models.
+
+    The default is a lossless PNG at viewport size. Lossy formats, a smaller
+    `max_edge` and grayscale all shrink the payload sent on every iteration.
+    """
+
+    format: Literal["png", "jpeg", "webp"] = "png"
+    quality: int = 80
+    max_edge: Optional[int] = None
+    grayscale: bool = False
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self.format == "jpeg" else self.format
+
+    def is_passthrough(self, width: int, height: int) -> bool:
+        """Whether the raw PNG from the browser can be used as is."""
+        return (
+            self.format == "png"
+            and not self.grayscale
+            and (not self.max_edge or max(width, height) <= self.max_edge)
+        )
+
+
+@dataclass(eq=False)
+class Screenshot:
+    """An encoded screenshot held in memory, shared by every consumer in an iteration.
+
+    `width`/`height` are the size of the encoded image, `viewport_width`/
+    `viewport_height` the size of the viewport it was taken of, in CSS pixels.
+    """
+
+    data: bytes
+    width: int
+    height: int
+    mime_type: str = "image/png"
+    path: Optional[str] = None
+    viewport_width: Optional[int] = None
+    viewport_height: Optional[int] = None
+
+    def __post_init__(self):
+        if self.viewport_width is None:
+            self.viewport_width = self.width
+        if self.viewport_height is None:
+            self.viewport_height = self.height
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.data)
+
+    @cached_property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+    @cached_property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @cached_property
+    def content_id(self) -> str:
+        """An id derived from the image content, the same for identical screenshots."""
+        return hashlib.sha256(self.data).hexdigest()[:16]
 
-            await page.screenshot(path=temp_filename, type="png")
-            return temp_filename, ActionResult(
-                success=True, output=f"Screenshot saved to {temp_filename}"
+    def thumbnail(self, max_edge: int = 320, quality: int = 60) -> bytes:
+        """Get a JPEG of the screenshot scaled down to at most `max_edge` pixels on its longest side."""
+        with Image.open(io.BytesIO(self.data)) as img:
+            img = img.convert("RGB")
+            img.thumbnail((max_edge, max_edge), Image.Resampling.BILINEAR)
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=quality)
+            return buffer.getvalue()
+
+    def image_input(self) -> ScreenshotImageInput:
+        return ScreenshotImageInput(data_url=self.data_url)
+
+    @cached_property
+    def fingerprint(self) -> bytes:
+        """A small grayscale thumbnail used to tell whether the page changed visually."""
+        with Image.open(io.BytesIO(self.data)) as img:
+            thumbnail = img.convert("L").resize(FINGERPRINT_SIZE, Image.Resampling.BOX)
+            return thumbnail.tobytes()
+
+    def difference(self, other: "Screenshot") -> float:
+        """Get the fraction of the page that visibly differs from another screenshot (0.0 - 1.0)."""
+        a = Image.frombytes("L", FINGERPRINT_SIZE, self.fingerprint)
+        b = Image.frombytes("L", FINGERPRINT_SIZE, other.fingerprint)
+        changed = ImageChops.difference(a, b).point(
+            lambda p: 255 if p > FINGERPRINT_TOLERANCE else 0
+        )
+        return changed.histogram()[255] / (FINGERPRINT_SIZE[0] * FINGERPRINT_SIZE[1])
+
+    def save(self, path: str) -> str:
+        """Write the screenshot to disk and remember where it was written."""
+        with open(path, "wb") as f:
+            f.write(self.data)
+        self.path = path
+        return path
+
+
+def _png_size(data: bytes):
+    # Width and height are the first two fields of the IHDR chunk
+    return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+
+
+def encode_screenshot(
+    png: bytes, encoding: ScreenshotEncoding, viewport: Optional[dict] = None
+) -> Screenshot:
+    """Encode a raw PNG screenshot according to the given encoding policy."""
+    width, height = _png_size(png)
+    viewport_width = viewport["width"] if viewport else width
+    viewport_height = viewport["height"] if viewport else height
+
+    if encoding.is_passthrough(width, height):
+        return Screenshot(
+            data=png,
+            width=width,
+            height=height,
+            viewport_width=viewport_width,
+            viewport_height=viewport_height,
+        )
+
+    with Image.open(io.BytesIO(png)) as img:
+        img = img.convert("L" if encoding.grayscale else "RGB")
+        if encoding.max_edge and max(img.size) > encoding.max_edge:
+            scale = encoding.max_edge / max(img.size)
+            img = img.resize(
+                (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                Image.Resampling.LANCZOS,
             )
+
+        buffer = io.BytesIO()
+        if encoding.format == "png":
+            img.save(buffer, format="PNG", optimize=True)
+        else:
+            img.save(buffer, format=encoding.format.upper(), quality=encoding.quality)
+
+        return Screenshot(
+            data=buffer.getvalue(),
+            width=img.width,
+            height=img.height,
+            mime_type=encoding.mime_type,
+            viewport_width=viewport_width,
+            viewport_height=viewport_height,
+        )
+
+
+def _encode_and_fingerprint(png, encoding, viewport) -> Screenshot:
+    screenshot = encode_screenshot(png, encoding, viewport)
+    screenshot.fingerprint
+    return screenshot
+
+
+async def take_screenshot(
+    page, path: Optional[str] = None, encoding: Optional[ScreenshotEncoding] = None
+):
+    """Take a screenshot of the current page state, only writing it to disk when a path is given."""
+    try:
+        encoding = encoding or ScreenshotEncoding()
+        png = await page.screenshot(type="png")
+        # Re-encoding and fingerprinting are CPU bound, so keep them off the event loop
+        screenshot = await asyncio.to_thread(
+            _encode_and_fingerprint, png, encoding, page.viewport_size
+        )
+        if path:
+            screenshot.save(path)
+        return screenshot, ActionResult(
+            success=True,
+            output=f"Screenshot taken ({screenshot.width}x{screenshot.height}, {screenshot.size_bytes} bytes)",
+        )
     except Exception as e:
         return None, ActionResult(success=False, error=str(e))
 
@@ -1,12 +1,152 @@
+from typing import Optional
+
 from ..models import ActionResult
+from ..text import token_overlap, tokenize
+
+# How far one scroll step moves, as a fraction of the visible height
+SCROLL_FRACTION = 0.8
+
+# Words of a scroll description that say nothing about where to scroll
+SCROLL_WORDS = {
+    "scroll", "scrolling", "down", "up", "more", "further", "see", "view", "find", "look",
+    "show", "reveal", "load", "additional", "below", "above", "bottom", "top", "next",
+    "previous", "rest", "until", "get", "inside", "within", "into",
+}
+
+# Nouns that name a scrollable region inside the page rather than the page itself
+REGION_WORDS = {
+    "sidebar", "panel", "pane", "list", "dropdown", "menu", "modal", "dialog", "popup",
+    "popover", "table", "grid", "container", "frame", "iframe", "box", "drawer",
+    "carousel", "column", "widget", "chat", "accordion", "overlay",
+}
+
+# How closely a scrollable element must match the named region to scroll it without vision
+REGION_MATCH = 0.5
+
+_SCROLL_AT_CENTER = """([direction, fraction]) => {
+    const canScroll = (el) => {
+        const style = window.getComputedStyle(el);
+        if (!['auto', 'scroll', 'overlay'].includes(style.overflowY)) return false;
+        if (el.scrollHeight <= el.clientHeight + 1) return false;
+        return direction > 0
+            ? el.scrollTop + el.clientHeight < el.scrollHeight - 1
+            : el.scrollTop > 0;
+    };
+
+    let target = null;
+    let el = document.elementFromPoint(window.innerWidth / 2, window.innerHeight / 2);
+    for (; el && el !== document.body && el !== document.documentElement; el = el.parentElement) {
+        if (canScroll(el) && (!target || el.clientWidth * el.clientHeight > target.clientWidth * target.clientHeight)) {
+            target = el;
+        }
+    }
+
+    const scroller = target || document.scrollingElement || document.documentElement;
+    const height = target ? target.clientHeight : window.innerHeight;
+    const before = scroller.scrollTop;
+    scroller.scrollBy({top: direction * height * fraction, behavior: 'instant'});
+    return {container: Boolean(target), moved: scroller.scrollTop - before};
+}"""
+
+
+_SCROLL_REGIONS = """() => {
+    const regions = [];
+    document.querySelectorAll('[data-webagent-scroll]').forEach((el) => el.removeAttribute('data-webagent-scroll'));
+    for (const el of document.querySelectorAll('body *')) {
+        const style = window.getComputedStyle(el);
+        if (!['auto', 'scroll', 'overlay'].includes(style.overflowY)) continue;
+        if (el.scrollHeight <= el.clientHeight + 1 || el.clientHeight === 0) continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.bottom <= 0 || rect.top >= window.innerHeight) continue;
+        const heading = el.querySelector('h1, h2, h3, h4, legend, [role="heading"]');
+        el.setAttribute('data-webagent-scroll', String(regions.length));
+        regions.push([
+            el.tagName.toLowerCase(),
+            el.getAttribute('role') || '',
+            el.getAttribute('aria-label') || '',
+            el.id || '',
+            typeof el.className === 'string' ? el.className.replace(/[-_]/g, ' ') : '',
+            heading ? heading.innerText.slice(0, 80) : '',
+        ].join(' '));
+    }
+    return regions;
+}"""
+
+_SCROLL_REGION = """([index, direction, fraction]) => {
+    const el = document.querySelector(`[data-webagent-scroll="${index}"]`);
+    if (!el) return null;
+    const before = el.scrollTop;
+    el.scrollBy({top: direction * el.clientHeight * fraction, behavior: 'instant'});
+    return el.scrollTop - before;
+}"""
+
+
+def _singular(token: str) -> str:
+    return token[:-1] if token.endswith("s") and token[:-1] in REGION_WORDS else token
+
+
+def is_page_scroll(description: Optional[str]) -> bool:
+    """Whether a scroll description refers to the page as a whole, as it does unless it names a region."""
+    return not any(_singular(token) in REGION_WORDS for token in tokenize(description or ""))
+
+
+async def scroll_region(page, description: str, direction="down", fraction=SCROLL_FRACTION):
+    """Scroll the scrollable element in view that best matches a region description.
+
+    When no element is scrollable the page itself is scrolled, as the
+    region can only be part of it. Returns None, without scrolling, when
+    scrollable elements exist but none matches well enough.
+    """
+    query = " ".join(
+        _singular(token) for token in tokenize(description) if token not in SCROLL_WORDS
+    )
+    regions = await page.evaluate(_SCROLL_REGIONS)
+    if not regions:
+        return await scroll_viewport(page, direction, fraction)
+    scored = [
+        (token_overlap(query, " ".join(_singular(t) for t in tokenize(label))), index)
+        for index, label in enumerate(regions)
+    ]
+    score, index = max(scored, default=(0.0, None))
+    if index is None or score < REGION_MATCH:
+        return None
+    moved = await page.evaluate(
+        _SCROLL_REGION, [index, 1 if direction == "down" else -1, fraction]
+    )
+    if moved is None:
+        return None
+    return ActionResult(
+        success=True, output=f"Scrolled the {query} {direction} by {abs(round(moved))}px"
+    )
+
+
+async def scroll_viewport(page, direction="down", fraction=SCROLL_FRACTION):
+    """Scroll the page, or the largest scrollable container under the viewport centre."""
+    try:
+        scrolled = await page.evaluate(
+            _SCROLL_AT_CENTER, [1 if direction == "down" else -1, fraction]
+        )
+        target = "the main scroll area" if scrolled["container"] else "the page"
+        if not scrolled["moved"]:
+            return ActionResult(
+                success=True,
+                output=f"Could not scroll {direction}, {target} is already at the {'bottom' if direction == 'down' else 'top'}",
+            )
+        return ActionResult(
+            success=True,
+            output=f"Scrolled {target} {direction} by {abs(round(scrolled['moved']))}px",
+        )
+    except Exception as e:
+        return ActionResult(success=False, error=str(e))
 
 
-async def scroll_page(page, x, y, direction="down"):
+async def scroll_page(page, x, y, direction="down", fraction=SCROLL_FRACTION):
     """Scroll the page up or down at specific coordinates."""
     try:
         await page.mouse.move(x, y)
-        delta = 250 if direction == "down" else -250
-        await page.mouse.wheel(0, delta)
+        viewport = page.viewport_size or {"height": 720}
+        delta = round(viewport["height"] * fraction)
+        await page.mouse.wheel(0, delta if direction == "down" else -delta)
         return ActionResult(success=True, output=f"Scrolled {direction} at ({x}, {y})")
     except Exception as e:
         return ActionResult(success=False, error=str(e))
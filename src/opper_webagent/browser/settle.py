@@ -0,0 +1,133 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+# Requests that may stay open without the page being busy (analytics, long polling)
+NETWORK_IDLE_ALLOWANCE = 2
+
+POLL_INTERVAL = 0.05
+
+_MS_SINCE_LAST_MUTATION = """() => {
+    if (!window.__webagentSettle) {
+        window.__webagentSettle = {last: performance.now()};
+        new MutationObserver(() => { window.__webagentSettle.last = performance.now(); })
+            .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    }
+    return performance.now() - window.__webagentSettle.last;
+}"""
+
+
+@dataclass
+class SettleResult:
+    seconds: float
+    settled: bool
+    reason: str
+
+
+class PageActivity:
+    """The requests and main frame navigations of a page, watched from before an action is taken.
+
+    Starting to watch before the action catches the document request of a
+    navigation the action starts, which would otherwise look like an
+    already loaded page with a few requests still open.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.inflight = set()
+        # Document requests of the main frame that have not finished yet
+        self.navigations = set()
+        self.last_activity = time.monotonic()
+
+    def __enter__(self) -> "PageActivity":
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_request_done)
+        self.page.on("requestfailed", self._on_request_done)
+        self.page.on("framenavigated", self._on_frame_navigated)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_request_done)
+        self.page.remove_listener("requestfailed", self._on_request_done)
+        self.page.remove_listener("framenavigated", self._on_frame_navigated)
+
+    def idle(self, now: float, quiet: float) -> bool:
+        """Whether no document is loading and the network has been calm for `quiet` seconds."""
+        return (
+            not self.navigations
+            and len(self.inflight) <= NETWORK_IDLE_ALLOWANCE
+            and now - self.last_activity >= quiet
+        )
+
+    def _on_request(self, request):
+        self.inflight.add(request)
+        self.last_activity = time.monotonic()
+        try:
+            if request.is_navigation_request() and request.frame == self.page.main_frame:
+                self.navigations.add(request)
+        except Exception:
+            # The frame of the request is already gone
+            pass
+
+    def _on_request_done(self, request):
+        self.inflight.discard(request)
+        self.navigations.discard(request)
+        self.last_activity = time.monotonic()
+
+    def _on_frame_navigated(self, frame):
+        if frame == self.page.main_frame:
+            self.last_activity = time.monotonic()
+
+
+async def wait_for_settle(
+    page,
+    min_wait: float = 0.1,
+    max_wait: float = 5.0,
+    quiet: float = 0.3,
+    activity: Optional[PageActivity] = None,
+) -> SettleResult:
+    """Wait until the page is stable, or until `max_wait` seconds have passed.
+
+    The page is stable once any pending navigation has loaded and there has
+    been no network activity and no DOM mutation for `quiet` seconds. At least
+    `min_wait` seconds are always waited. Pass the `activity` watched since
+    before the action, so navigations it started are waited for.
+    """
+    if activity is None:
+        with PageActivity(page) as activity:
+            return await wait_for_settle(page, min_wait, max_wait, quiet, activity)
+
+    started = time.monotonic()
+    deadline = started + max_wait
+    try:
+        await page.wait_for_load_state(
+            "domcontentloaded", timeout=max((deadline - time.monotonic()) * 1000, 1)
+        )
+    except Exception:
+        return SettleResult(time.monotonic() - started, False, "navigation pending")
+
+    # Start watching for DOM mutations while the network calms down
+    try:
+        await page.evaluate(_MS_SINCE_LAST_MUTATION)
+    except Exception:
+        pass
+
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            reason = "navigation pending" if activity.navigations else "max wait reached"
+            return SettleResult(now - started, False, reason)
+
+        if now - started >= min_wait and activity.idle(now, quiet):
+            try:
+                # A new document gets a new observer, so it must be quiet on its own
+                dom_quiet = await page.evaluate(_MS_SINCE_LAST_MUTATION) >= quiet * 1000
+            except Exception:
+                # The document is being replaced, e.g. by a client side navigation
+                dom_quiet = False
+            if dom_quiet:
+                return SettleResult(time.monotonic() - started, True, "stable")
+
+        await asyncio.sleep(POLL_INTERVAL)
@@ -1,7 +1,21 @@
-from playwright.async_api import Playwright
+from playwright.async_api import Browser, Playwright
 
 from .screenshot import set_page_zoom
 
+VIEWPORT = {"width": 1280, "height": 720}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+async def create_context(browser: Browser):
+    """Create a fresh, isolated browser context with a single page open"""
+    context = await browser.new_context(viewport=VIEWPORT, user_agent=USER_AGENT)
+    page = await context.new_page()
+
+    # Set initial zoom level
+    await set_page_zoom(page, 1)
+
+    return context, page
+
 
 async def setup_browser(
     playwright: Playwright,
@@ -16,14 +30,7 @@ async def setup_browser(
     browser_args["headless"] = headless
 
     browser = await playwright.chromium.launch(**browser_args)
-    context = await browser.new_context(
-        viewport={"width": 1280, "height": 720},
-        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-    page = await context.new_page()
-
-    # Set initial zoom level 
-    await set_page_zoom(page, 1)
+    _, page = await create_context(browser)
 
     # Save storage on exit
     # NOTE: unclear how this works with _cleanup_resources
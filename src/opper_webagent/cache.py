@@ -0,0 +1,181 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+    evictions: int = 0
+
+
+class MemoryCache:
+    """An in-memory LRU cache of strings, bounded by entry count, total size and age."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 3600,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._size = 0
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0]):
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self._stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: str):
+        if key in self._entries:
+            self._remove(key)
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._stats.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        self._stats.entries = len(self._entries)
+        self._stats.size_bytes = self._size
+        return asdict(self._stats)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._size -= len(value.encode())
+
+
+class DiskCache:
+    """A cache of strings in a SQLite file, shared by every agent and process using the same path.
+
+    Entries older than `ttl_seconds` are ignored, and the least recently
+    used entries are dropped once there are more than `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 24 * 3600,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._stats.misses += 1
+                return None
+            self._db.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+            self._stats.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            deleted = self._db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._stats.evictions += max(deleted, 0)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+            ).fetchone()
+        self._stats.entries = entries
+        self._stats.size_bytes = size
+        return asdict(self._stats)
+
+
+def default_cache(env_var: str):
+    """Get a DiskCache at the path in `env_var` if it is set, or else a MemoryCache."""
+    path = os.getenv(env_var)
+    return DiskCache(path) if path else MemoryCache()
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL so that trivially different spellings of the same page compare equal."""
+    parts = urlsplit(url or "")
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def content_key(*parts: str) -> str:
+    """Hash any number of strings into a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def look_cache_key(url: str, text: str, action_goal: str) -> str:
+    """Get the cache key of a look at a page: its URL, the hash of its text and the goal."""
+    text_hash = hashlib.sha256(text.encode()).hexdigest()
+    goal = " ".join((action_goal or "").lower().split())
+    return content_key("look", normalize_url(url), text_hash, goal)
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field, replace
+from typing import List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from .cache import DiskCache, MemoryCache, content_key
+
+# Actions that take the page somewhere, and so are worth replaying
+REPLAYABLE_ACTIONS = {"navigate", "click", "type", "scroll_down", "scroll_up", "wait"}
+
+# Longest path kept as a macro
+MAX_MACRO_STEPS = 30
+
+_PARAM_RE = re.compile(
+    r"https?://\S+"  # URLs
+    r"|\"[^\"]+\"|'[^']+'|“[^”]+”|‘[^’]+’"  # quoted text
+    r"|[\w.+-]+@[\w-]+\.[\w.-]+"  # email addresses
+    r"|\b\d+(?:[.,:]\d+)*\b"  # numbers, prices, dates and times
+)
+_DOMAIN_RE = re.compile(r"\b((?:[a-z0-9-]+\.)+[a-z]{2,})\b", re.IGNORECASE)
+_PLACEHOLDER_RE = re.compile(r"\{\d+\}")
+
+
+@dataclass
+class GoalSignature:
+    """A goal with its specifics taken out: the site it is about, its template and its parameters."""
+
+    domain: str
+    template: str
+    params: List[str]
+
+    @property
+    def key(self) -> str:
+        return content_key("macro", self.domain, self.template)
+
+
+def _host(url: str) -> str:
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def parse_goal(goal: str) -> GoalSignature:
+    """Split a goal into its site, a template and the values that differ between similar goals.
+
+    URLs, quoted text, email addresses and numbers are parameters, so
+    'Search "red shoes" on shop.com' and 'Search "blue hats" on shop.com'
+    share a template.
+    """
+    params = []
+    domain = ""
+
+    def take(match):
+        nonlocal domain
+        value = match.group(0)
+        if value.startswith("http"):
+            value = value.rstrip(".,;)")
+            domain = domain or _host(value)
+        elif value[0] in "\"'“‘":
+            value = value[1:-1]
+        params.append(value)
+        return "{}"
+
+    template = _PARAM_RE.sub(take, goal)
+    if not domain:
+        match = _DOMAIN_RE.search(template)
+        if match:
+            domain = match.group(1).lower()
+            domain = domain[4:] if domain.startswith("www.") else domain
+    template = " ".join(template.lower().split())
+    return GoalSignature(domain=domain, template=template, params=params)
+
+
+@dataclass
+class MacroStep:
+    """One action of a macro, with goal parameters as `{0}`, `{1}`... placeholders in `param`.
+
+    `url` is the page the action was taken on and `label` the text of the
+    element that was clicked, when it was found in the DOM. `target` is the
+    URL a navigate step was recorded with.
+    """
+
+    action: str
+    param: str
+    action_goal: str
+    url: str
+    label: Optional[str] = None
+    target: Optional[str] = None
+
+    def fill(self, params: List[str]) -> "MacroStep":
+        """Put a goal's parameters in the step.
+
+        Raises ValueError when the parameters don't fit the step, or when a
+        navigate step would leave the host and path it was recorded with.
+        """
+        try:
+            param = self.param.format(*params)
+        except (IndexError, KeyError, ValueError) as e:
+            raise ValueError(f"could not fill in {self.param!r}: {str(e)}") from e
+        if self.action == "navigate" and self.target and not _same_target(self.param, param, self.target):
+            raise ValueError(f"would navigate to {param} instead of a page like {self.target}")
+        return replace(self, param=param)
+
+
+@dataclass
+class Macro:
+    domain: str
+    template: str
+    steps: List[MacroStep] = field(default_factory=list)
+
+
+def _templated(text: str, params: List[str]) -> str:
+    """Replace whole occurrences of the parameter values in a text with placeholders.
+
+    A value only counts where it is delimited, so the number 5 in a goal
+    does not replace the 5 in "127.0.0.5" or in "45234".
+    """
+    text = text.replace("{", "{{").replace("}", "}}")
+    values = {}
+    # Longer values first, so a value containing another is replaced whole
+    for index, value in sorted(enumerate(params), key=lambda item: -len(item[1])):
+        if value:
+            values.setdefault(value.replace("{", "{{").replace("}", "}}"), index)
+    if not values:
+        return text
+    pattern = re.compile(
+        r"(?<!\w)(?<!\d[.,:])(?:"
+        + "|".join(re.escape(value) for value in values)
+        + r")(?!\w)(?![.,:]\d)"
+    )
+    return pattern.sub(lambda match: f"{{{values[match.group(0)]}}}", text)
+
+
+def _same_target(template: str, filled: str, recorded: str) -> bool:
+    """Whether a filled navigate URL keeps the host and path of the recorded one.
+
+    Parts of the template that are a whole placeholder may differ, so a
+    goal naming another product id or site still matches.
+    """
+    if _PLACEHOLDER_RE.fullmatch(template):
+        return True
+    parts = [urlsplit(url) for url in (template, filled, recorded)]
+    hosts = [part.netloc for part in parts]
+    if hosts[1] != hosts[2] and not _PLACEHOLDER_RE.fullmatch(hosts[0].split(":")[0]):
+        return False
+    segments = [part.path.rstrip("/").split("/") for part in parts]
+    if len(segments[1]) != len(segments[2]):
+        return False
+    return all(
+        mine == theirs or _PLACEHOLDER_RE.fullmatch(own)
+        for own, mine, theirs in zip(segments[0], segments[1], segments[2])
+    )
+
+
+def same_page(url: str, other: str) -> bool:
+    """Whether two URLs point at the same page, ignoring the query and fragment."""
+    a, b = urlsplit(url or ""), urlsplit(other or "")
+    return _host(url) == _host(other) and (a.path.rstrip("/") == b.path.rstrip("/"))
+
+
+class MacroStore:
+    """Successful paths through a site, saved per site and goal template to replay on similar goals.
+
+    Kept in memory by default, or in SQLite at `WEBAGENT_MACRO_STORE` so
+    they are shared between agents and processes.
+    """
+
+    def __init__(self, backend: Union[MemoryCache, DiskCache, None] = None):
+        if backend is None:
+            path = os.getenv("WEBAGENT_MACRO_STORE")
+            backend = (
+                DiskCache(path, ttl_seconds=30 * 24 * 3600)
+                if path
+                else MemoryCache(max_entries=512, ttl_seconds=None)
+            )
+        self.backend = backend
+
+    def find(self, goal: str) -> Optional[Tuple[Macro, List[str]]]:
+        """Get the macro saved for goals like this one, and this goal's parameters."""
+        signature = parse_goal(goal)
+        stored = self.backend.get(signature.key)
+        if stored is None:
+            return None
+        data = json.loads(stored)
+        macro = Macro(
+            domain=data["domain"],
+            template=data["template"],
+            steps=[MacroStep(**step) for step in data["steps"]],
+        )
+        return macro, signature.params
+
+    def save(self, goal: str, steps: List[MacroStep]) -> bool:
+        """Save the steps that reached a goal as the macro for goals like it."""
+        steps = [step for step in steps if step.action in REPLAYABLE_ACTIONS]
+        if not steps or len(steps) > MAX_MACRO_STEPS:
+            return False
+        signature = parse_goal(goal)
+        macro = Macro(
+            domain=signature.domain,
+            template=signature.template,
+            steps=[
+                replace(
+                    step,
+                    param=_templated(step.param, signature.params),
+                    target=step.param if step.action == "navigate" else None,
+                )
+                for step in steps
+            ],
+        )
+        self.backend.set(signature.key, json.dumps(asdict(macro)))
+        return True
@@ -1,95 +1,292 @@
 import asyncio
+import copy
 import json
 import os
+import re
 import time
 import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from threading import Event
-from typing import Callable, Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-from opperai import trace, Opper
 from playwright.async_api import async_playwright
 
+from .admission import RunScheduler
+from .ai.calls import calls_replayable, start_trace
+from .ai.client import warm_up as warm_up_client
 from .ai.decide import decide_next_action
 from .ai.observe import get_page_observation
-from .ai.parse import look_at_page_content
+from .ai.parse import look_at_page, read_page_text
 from .ai.reflect import reflect_on_progress
 from .ai.response import bake_response
+from .ai.summarize import summarize_trajectory as summarize_steps
 from .ai.vision import find_coordinates
-from .browser.click import click_at_coordinates, draw_click_dot
+from .browser.click import click_at_coordinates, draw_click_dot, remove_click_dots
+from .browser.explore import background_tab, collect_links, rank_links
+from .browser.grounding import GroundingMatch, ground_element
 from .browser.navigate import navigate_to_url
-from .browser.screenshot import take_screenshot
-from .browser.scroll import scroll_page
+from .browser.pool import BrowserPool
+from .browser.routing import RoutingProfile, get_profile, install_routing
+from .browser.screenshot import ScreenshotEncoding, take_screenshot
+from .browser.settle import PageActivity, SettleResult, wait_for_settle
+from .browser.scroll import is_page_scroll, scroll_page, scroll_region, scroll_viewport
 from .browser.setup import setup_browser
 from .browser.type import type_text
-from .models import ActionResult
-from .status import StatusManager
+from .cache import DiskCache, MemoryCache, default_cache, look_cache_key
+from .macros import MacroStep, MacroStore, same_page
+from .models import Action, ActionResult, ScreenOutput
+from .scheduler import StageScheduler
+from .status import StatusEntry, StatusManager
+from .text import mutual_overlap, token_overlap
+from .timing import summarize_iterations
+from .trajectory import Trajectory
 from src.opper_webagent import status
 
-__all__ = ["WebAgent"]
+__all__ = ["WebAgent", "BatchGoal"]
+
+# Bounds for the explicit wait action, which waits at least a moment even on a stable page
+WAIT_ACTION_MIN_SECONDS = 1.0
+WAIT_ACTION_MAX_SECONDS = 10.0
+
+# How closely a click target must match a speculatively grounded element to reuse it
+SPECULATION_MATCH = 0.6
+
+# Longest text kept per page in the merged findings of the explore action
+EXPLORE_FINDING_CHARS = 1500
+
+_FOCUSED_FIELD = """() => {
+    const el = document.activeElement;
+    return !!el && (el.isContentEditable || ['INPUT', 'TEXTAREA', 'SELECT'].includes(el.tagName));
+}"""
+
+
+async def _resolved(value):
+    return value
+
+
+@dataclass
+class BatchGoal:
+    """One goal of a `WebAgent.run_many` batch, with its own schema, timeout and queue placement."""
+
+    goal: str
+    response_schema: Optional[Dict] = None
+    secrets: Optional[str] = None
+    timeout_seconds: Optional[float] = None
+    max_iterations: Optional[int] = None
+    priority: int = 0
+    tenant: Optional[str] = None
+    session_id: Optional[str] = None
 
-opper = Opper()
 
 class WebAgent:
     def __init__(
         self,
         status_callback: Optional[Callable[[str, str], None]] = None,
         max_iterations: Optional[int] = None,
+        browser_pool: Optional[BrowserPool] = None,
+        screenshot_dir: Optional[str] = None,
+        screenshot_encoding: Optional[ScreenshotEncoding] = None,
+        observation_reuse_threshold: Optional[float] = 0.0001,
+        speculative_grounding: bool = True,
+        dom_grounding_threshold: Optional[float] = 0.75,
+        settle_min_seconds: float = 0.1,
+        settle_max_seconds: float = 5.0,
+        warm_up: bool = False,
+        trajectory_window: Optional[int] = None,
+        summarize_trajectory: bool = True,
+        look_cache: Union[MemoryCache, DiskCache, bool] = True,
+        routing_profile: Union[str, RoutingProfile, None] = None,
+        macros: Union[MacroStore, bool] = True,
+        scheduler: Optional[RunScheduler] = None,
+        status_history: Optional[int] = None,
+        explore_max_tabs: int = 5,
+        explore_concurrency: Optional[int] = None,
     ):
         self.status_callback = status_callback
         self.max_iterations = max_iterations or int(os.getenv("WEBAGENT_MAX_ITERATIONS", "100"))
+        self.browser_pool = browser_pool
+        self.screenshot_dir = screenshot_dir
+        self.screenshot_encoding = screenshot_encoding or ScreenshotEncoding()
+        # Reuse the previous observation when less than this fraction of the page changed
+        self.observation_reuse_threshold = observation_reuse_threshold
+        # Ground the likely click target while the next action is still being decided
+        self.speculative_grounding = speculative_grounding
+        # Click DOM matches at least this confident directly, instead of asking the vision model
+        self.dom_grounding_threshold = dom_grounding_threshold
+        # Bounds for waiting on the page to settle after an action
+        self.settle_min_seconds = settle_min_seconds
+        self.settle_max_seconds = settle_max_seconds
+        # Steps kept in full, older ones are rolled into a summary (by a model unless disabled)
+        self.trajectory_window = trajectory_window or int(
+            os.getenv("WEBAGENT_TRAJECTORY_WINDOW", "20")
+        )
+        self.summarize_trajectory = summarize_trajectory
+        # Reuse looks at the same page text for the same goal, kept across runs
+        if look_cache is True:
+            look_cache = default_cache("WEBAGENT_LOOK_CACHE_PATH")
+        self.look_cache = look_cache or None
+        # Which requests to block: "full", "no-media", "minimal" or a custom RoutingProfile
+        self.routing_profile = get_profile(routing_profile)
+        # Replay the saved path of an earlier successful run on a goal like this one
+        if macros is True:
+            macros = MacroStore()
+        self.macros = macros or None
+
+        # Limits how many runs, and so browsers and model loops, are in progress at once
+        self.scheduler = scheduler
+        # Status updates kept per run for get_status_history and late subscribers
+        self.status_history = status_history
+        # Links the explore action opens at most, and how many of its tabs load at once
+        self.explore_max_tabs = explore_max_tabs
+        self.explore_concurrency = explore_concurrency or int(
+            os.getenv("WEBAGENT_EXPLORE_CONCURRENCY", "3")
+        )
+
+        # Open connections to Opper ahead of the first call, now if possible or else on the first run
+        self._warm_up = warm_up
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._start_warm_up()
 
         self._stop_event = Event()
         self._stop_event.clear()
-        self._screenshot_files: List[str] = []
-        self._status_manager = StatusManager(status_callback)
+        self._batch_agents: List["WebAgent"] = []
+        self._session_id: Optional[str] = None
+        self._screenshot_count = 0
+        self._iterations: List[Dict] = []
+        self._last_observation = None
+        self._observation_hits = 0
+        self._observation_misses = 0
+        self._look_hits = 0
+        self._look_misses = 0
+        self._performed: List[MacroStep] = []
+        self._click_dot_drawn = False
+        self._status_manager = StatusManager(status_callback, history_size=status_history)
+
+    def _start_warm_up(self):
+        if not self._warm_up or self._warm_up_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._warm_up_task = loop.create_task(warm_up_client())
 
     def get_status(self) -> Dict:
         """Get the current status of the web agent."""
         if self._status_manager:
             return self._status_manager.get_current()
-        return {"action": None, "details": None, "screenshot_path": None}
+        return {"action": None, "details": None, "screenshot": None}
+
+    def get_status_history(
+        self, cursor: Optional[int] = None, limit: Optional[int] = None
+    ) -> List[StatusEntry]:
+        """Get the status updates of the current run after the `cursor` sequence, at most `limit`."""
+        return self._status_manager.get_history(cursor, limit)
+
+    def subscribe_status(self, cursor: Optional[int] = None) -> AsyncIterator[StatusEntry]:
+        """Follow the status updates of the current run, from after `cursor` until it ends."""
+        return self._status_manager.subscribe(cursor)
 
     def stop(self):
-        """Stop the currently running navigation."""
+        """Stop the currently running navigation, and every run of a batch in progress."""
         self._stop_event.set()
+        for agent in self._batch_agents:
+            agent.stop()
 
-    @trace(name="attempt")
     async def attempt(self, page, browser, goal, subgoal, trajectory, response_schema):
         """Execute one round of the agent's decision-making and action loop."""
-        # Make the last opened page active
-        pages = browser.contexts[0].pages
+        iteration = {"iteration": len(self._iterations) + 1, "screenshot_bytes_sent": 0}
+        self._iterations.append(iteration)
+        scheduler = StageScheduler()
+        started = time.monotonic()
+        try:
+            async with start_trace("attempt"):
+                return await self._attempt(
+                    page, goal, subgoal, trajectory, response_schema, iteration, scheduler
+                )
+        finally:
+            await scheduler.close()
+            iteration["duration_seconds"] = time.monotonic() - started
+            iteration["stage_seconds"] = scheduler.durations
+
+    async def _attempt(
+        self, page, goal, subgoal, trajectory, response_schema, iteration, scheduler
+    ):
+        # Make the last opened page of this run's context active
+        pages = page.context.pages
         if pages:
             page = pages[-1]
 
-        # Take a screenshot of the current page
-        screenshot_path, screenshot_result = await take_screenshot(page)
-        if screenshot_path:
-            self._screenshot_files.append(screenshot_path)
+        # Read the page text alongside the observation in case the action is a look
+        scheduler.start("page_text", read_page_text(page), speculative=True)
+
+        # The click indicator would make an unchanged page look different to observation reuse
+        if self._click_dot_drawn:
+            await remove_click_dots(page)
+            self._click_dot_drawn = False
+
+        # Take a screenshot of the current page, kept in memory unless a screenshot_dir is set
+        screenshot, screenshot_result = await scheduler.run(
+            "screenshot",
+            take_screenshot(
+                page, path=self._next_screenshot_path(), encoding=self.screenshot_encoding
+            ),
+        )
+        if screenshot:
+            iteration["screenshot_bytes"] = screenshot.size_bytes
         if not screenshot_result.success:
             trajectory.append(
                 {"action": "screenshot", "result": f"Failed: {screenshot_result.error}"}
             )
 
-        # Produce an observation of the current page
-        result = get_page_observation(subgoal, trajectory, screenshot_path)
-        trajectory.append(
-            {
-                "action": "observation",
-                "result": result.observation if result else "Failed to get observation",
-            }
-        )
+        # Produce an observation of the current page, unless it looks the same as last time
+        result = self._reusable_observation(page, screenshot)
+        iteration["observation_reused"] = result is not None
+        if result is not None:
+            self._observation_hits += 1
+            trajectory.append(
+                {
+                    "action": "observation",
+                    "result": f"(page unchanged since the previous step) {result.observation}",
+                }
+            )
+        else:
+            self._observation_misses += 1
+            self._record_image_sent(iteration, screenshot)
+            await trajectory.catch_up()
+            result = await scheduler.run(
+                "observe", get_page_observation(subgoal, trajectory, screenshot)
+            )
+            if isinstance(result, ScreenOutput):
+                self._last_observation = (page.url, screenshot, result)
+            else:
+                self._last_observation = None
+            trajectory.append(
+                {
+                    "action": "observation",
+                    "result": result.observation
+                    if isinstance(result, ScreenOutput)
+                    else "Failed to get observation",
+                }
+            )
 
         # Given the page, decide what to do
-        decision = reflect_on_progress(goal, page.url, trajectory)
-        self._status_manager.update("reflection", decision.reflection, screenshot_path)
+        await trajectory.catch_up()
+        decision = await scheduler.run(
+            "reflect", reflect_on_progress(goal, page.url, trajectory)
+        )
+        self._status_manager.update("reflection", decision.reflection, screenshot)
 
         if decision.decision == "finished":
-            self._status_manager.update("finishing up", decision.param, screenshot_path)
+            self._status_manager.update("finishing up", decision.param, screenshot)
             completed_result = decision.param
 
             if response_schema:
                 try:
-                    final_response = bake_response(completed_result, response_schema)
+                    final_response = await scheduler.run(
+                        "respond", bake_response(completed_result, response_schema)
+                    )
                     completed_result = final_response
                 except Exception as e:
                     completed_result = {
@@ -100,12 +297,14 @@ class WebAgent:
             return "finished", completed_result
 
         elif decision.decision == "break":
-            self._status_manager.update("breaking", decision.param, screenshot_path)
+            self._status_manager.update("breaking", decision.param, screenshot)
             completed_result = decision.param
 
             if response_schema:
                 try:
-                    final_response = bake_response(completed_result, response_schema)
+                    final_response = await scheduler.run(
+                        "respond", bake_response(completed_result, response_schema)
+                    )
                     completed_result = final_response
                 except Exception as e:
                     completed_result = {
@@ -116,135 +315,249 @@ class WebAgent:
             return "break", completed_result
 
         elif decision.decision == "continue":
-            # Construct an action of what to do next
-            action = decide_next_action(decision.param, page.url, trajectory, result)
-
-            # Take action on actions
-            if action.action == "navigate":
-                
-                self._status_manager.update(
-                    "navigating", f"Going to {action.param}", screenshot_path
-                )
-                result = await navigate_to_url(page, action.param)
-                await asyncio.sleep(1)
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "navigate",
-                        "param": action.param,
-                        "result": result.output if result.success else result.error,
-                    }
-                )
-                
+            # Construct an action of what to do next, grounding the likely click target meanwhile
+            scheduler.start(
+                "decide", decide_next_action(decision.param, page.url, trajectory, result)
+            )
+            speculative_target = self._start_speculative_grounding(
+                scheduler, iteration, page, screenshot, decision.param, result
+            )
+            action = await scheduler.result("decide")
 
-            elif action.action == "look":
-                self._status_manager.update(
-                    "looking", f"{action.action_goal}", screenshot_path
-                )
-                try:
-                    result = await look_at_page_content(page, action.action_goal)
-                except Exception as e:
-                    result = f"Looking failed: {str(e)}"
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "look",
-                        "param": action.param,
-                        "result": result,
-                    }
-                )
+            entry, _ = await self._execute_action(
+                page, action, screenshot, iteration, scheduler, speculative_target
+            )
+            trajectory.append(entry)
 
-            elif action.action == "click":
-                self._status_manager.update(
-                    "clicking", f"Finding and clicking {action.param}", screenshot_path
-                )
+            return "continue", None
+
+    async def _execute_action(
+        self, page, action, screenshot, iteration, scheduler, speculative_target=None
+    ) -> Tuple[Dict, bool]:
+        """Carry out a decided action and get its trajectory entry and whether it succeeded.
+
+        Actions that succeed are also kept, with the URL they were taken
+        on, to save the run as a macro if it finishes.
+        """
+        # Watched from before the action, so a navigation it starts is waited for when settling
+        with PageActivity(page) as activity:
+            return await self._perform_action(
+                page, action, screenshot, iteration, scheduler, speculative_target, activity
+            )
+
+    async def _perform_action(
+        self, page, action, screenshot, iteration, scheduler, speculative_target, activity
+    ) -> Tuple[Dict, bool]:
+        url = page.url
+        success = True
+        label = None
+
+        if action.action == "navigate":
+            self._status_manager.update("navigating", f"Going to {action.param}", screenshot)
+            result = await scheduler.run("navigate", navigate_to_url(page, action.param))
+            await self._settle(page, iteration, scheduler, activity)
+
+        elif action.action == "look":
+            self._status_manager.update("looking", f"{action.action_goal}", screenshot)
+            try:
                 try:
-                    x, y = find_coordinates(screenshot_path, "click " + action.param)
-                    html = page.locator("html")
-                    bbox = await html.bounding_box()
-                    scroll_y = abs(bbox["y"])
-                    y = y + scroll_y
-                    await draw_click_dot(page, x, y)
-                    result = await click_at_coordinates(page, x, y)
-                    await asyncio.sleep(1)
-                except Exception as e:
-                    result = ActionResult(success=False, error=str(e))
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "click",
-                        "param": action.param,
-                        "result": result.output if result.success else result.error,
-                    }
+                    text_content = await scheduler.result("page_text")
+                except Exception:
+                    text_content = None
+                result = await scheduler.run(
+                    "look", self._look(page, action.action_goal, text_content, iteration)
                 )
+            except Exception as e:
+                success = False
+                result = f"Looking failed: {str(e)}"
 
-            elif action.action == "type":
-                self._status_manager.update(
-                    "typing", f"Entering text: {action.param}", screenshot_path
-                )
-                result = await type_text(page, action.param)
-                await asyncio.sleep(1)
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "type",
-                        "param": action.param,
-                        "result": result.output if result.success else result.error,
-                    }
-                )
+        elif action.action == "explore":
+            self._status_manager.update("exploring", f"Opening {action.param}", screenshot)
+            try:
+                result = await scheduler.run("explore", self._explore(page, action, iteration))
+            except Exception as e:
+                success = False
+                result = f"Exploring failed: {str(e)}"
 
-            elif action.action == "scroll_down":
-                self._status_manager.update(
-                    "scrolling", "Scrolling down", screenshot_path
+        elif action.action == "click":
+            self._status_manager.update(
+                "clicking", f"Finding and clicking {action.param}", screenshot
+            )
+            try:
+                # Both ways, so "Sign in" is not reused for "Sign in with Google"
+                if speculative_target and mutual_overlap(
+                    speculative_target, action.param
+                ) >= SPECULATION_MATCH:
+                    target = await scheduler.result("speculative_ground")
+                else:
+                    scheduler.cancel("speculative_ground")
+                    target = await scheduler.run(
+                        "ground",
+                        self._ground_click(page, screenshot, action.param, iteration),
+                    )
+                iteration["grounding"] = target.source
+                if target.source == "dom":
+                    label = target.label
+                await scheduler.run(
+                    "click_indicator", draw_click_dot(page, target.page_x, target.page_y)
                 )
-                try:
-                    x, y = find_coordinates(screenshot_path, "click" + action.param)
-                    result = await scroll_page(page, x, y, "down")
-                except Exception as e:
-                    result = ActionResult(success=False, error=str(e))
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "scroll_down",
-                        "param": action.param,
-                        "result": result.output if result.success else result.error,
-                    }
+                self._click_dot_drawn = True
+                result = await scheduler.run(
+                    "click", click_at_coordinates(page, target.x, target.y)
                 )
+                await self._settle(page, iteration, scheduler, activity)
+            except Exception as e:
+                result = ActionResult(success=False, error=str(e))
+
+        elif action.action == "type":
+            self._status_manager.update("typing", f"Entering text: {action.param}", screenshot)
+            result = await scheduler.run("type", type_text(page, action.param))
+            await self._settle(page, iteration, scheduler, activity)
+
+        elif action.action in ("scroll_down", "scroll_up"):
+            direction = "down" if action.action == "scroll_down" else "up"
+            self._status_manager.update("scrolling", f"Scrolling {direction}", screenshot)
+            result = await scheduler.run(
+                "scroll", self._scroll(page, screenshot, action.param, direction, iteration)
+            )
+
+        elif action.action == "wait":
+            self._status_manager.update(
+                "waiting", "Waiting for the page to settle", screenshot
+            )
+            settle = await self._settle(
+                page,
+                iteration,
+                scheduler,
+                activity,
+                min_wait=WAIT_ACTION_MIN_SECONDS,
+                max_wait=max(self.settle_max_seconds, WAIT_ACTION_MAX_SECONDS),
+            )
+            # How long it took is kept in the iteration, so the text sent to the model stays the
+            # same between runs and recorded model calls replay
+            result = "Waited for the page" + (
+                ", it is stable" if settle.settled else ", it is still changing"
+            )
 
-            elif action.action == "scroll_up":
-                self._status_manager.update(
-                    "scrolling", "Scrolling up", screenshot_path
+        else:
+            success = False
+            result = f"Nothing to do for action {action.action}"
+
+        if isinstance(result, ActionResult):
+            success = result.success
+            result = result.output if result.success else result.error
+        if success:
+            self._performed.append(
+                MacroStep(
+                    action=action.action,
+                    param=action.param,
+                    action_goal=action.action_goal,
+                    url=url,
+                    label=label,
                 )
+            )
+        entry = {
+            "action_goal": action.action_goal,
+            "action": action.action,
+            "param": action.param,
+            "url": url,
+            "result": result,
+        }
+        return entry, success
+
+    async def _replay_macro(self, page, goal, trajectory) -> Dict:
+        """Replay the saved path for goals like this one, for as long as the pages still match it.
+
+        Each step is checked before it is taken: the goal's parameters must
+        fill it in, a navigation must go to the host and path it was saved
+        with, the page must be the one the step was saved on, a click target
+        must be found in the DOM and typing needs a focused field. The model driven loop takes over from wherever
+        replay stops.
+        """
+        stats = {
+            "matched": False,
+            "steps_total": 0,
+            "steps_replayed": 0,
+            "fallback": None,
+            "saved": False,
+        }
+        found = self.macros.find(goal) if self.macros else None
+        if not found:
+            return stats
+
+        macro, params = found
+        stats.update(matched=True, steps_total=len(macro.steps))
+        self._status_manager.update(
+            "replaying", f"Replaying {len(macro.steps)} saved steps for this goal"
+        )
+        iteration = {"iteration": 0, "screenshot_bytes_sent": 0}
+        scheduler = StageScheduler()
+        started = time.monotonic()
+        try:
+            for step in macro.steps:
                 try:
-                    x, y = find_coordinates(screenshot_path, "click" + action.param)
-                    result = await scroll_page(page, x, y, "up")
-                except Exception as e:
-                    result = ActionResult(success=False, error=str(e))
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "scroll_up",
-                        "param": action.param,
-                        "result": result.output if result.success else result.error,
-                    }
-                )
+                    step = step.fill(params)
+                except ValueError as e:
+                    stats["fallback"] = f"step {stats['steps_replayed'] + 1} {str(e)}"
+                    break
+                problem, target = await self._verify_macro_step(page, step)
+                if problem:
+                    stats["fallback"] = problem
+                    break
 
-            elif action.action == "wait":
-                self._status_manager.update(
-                    "waiting", "Waiting for 5 seconds", screenshot_path
+                if target:
+                    # Click exactly what was verified instead of grounding the target again
+                    scheduler.start("speculative_ground", _resolved(target), speculative=True)
+                action = Action(
+                    thoughts="Replaying a saved step",
+                    action=step.action,
+                    action_goal=step.action_goal,
+                    param=step.param,
                 )
-                await asyncio.sleep(5)
-                result = "Waited 5 seconds"
-                trajectory.append(
-                    {
-                        "action_goal": action.action_goal,
-                        "action": "wait",
-                        "param": action.param,
-                        "result": result,
-                    }
+                entry, success = await self._execute_action(
+                    page, action, None, iteration, scheduler, step.param if target else None
                 )
+                entry["result"] = f"(replayed) {entry['result']}"
+                trajectory.append(entry)
+                if not success:
+                    stats["fallback"] = f"step {stats['steps_replayed'] + 1} failed"
+                    break
+                stats["steps_replayed"] += 1
+        finally:
+            await scheduler.close()
+            stats["duration_seconds"] = time.monotonic() - started
 
-            return "continue", None
+        summary = (
+            f"Replayed {stats['steps_replayed']} of {stats['steps_total']} steps saved "
+            "from an earlier run of a similar goal"
+        )
+        if stats["fallback"]:
+            summary += f", then stopped: {stats['fallback']}"
+        trajectory.append({"action": "macro", "result": summary})
+        return stats
+
+    async def _verify_macro_step(self, page, step) -> Tuple[Optional[str], Optional[GroundingMatch]]:
+        """Check that a saved step still fits the page. Returns what is wrong, and the click target."""
+        if step.action != "navigate" and not same_page(page.url, step.url):
+            return f"expected to be on {step.url} but was on {page.url}", None
+
+        if step.action == "click":
+            description = f'"{step.label}"' if step.label else step.param
+            target = await ground_element(page, description)
+            threshold = self.dom_grounding_threshold or 0.0
+            if not target or target.confidence < max(threshold, SPECULATION_MATCH):
+                return f"could not find {step.label or step.param} on the page", None
+            return None, target
+
+        if step.action == "type":
+            try:
+                focused = await page.evaluate(_FOCUSED_FIELD)
+            except Exception:
+                focused = False
+            if not focused:
+                return "no field was focused to type into", None
+
+        return None, None
 
     def _prepare_goal(
         self,
@@ -262,15 +575,232 @@ class WebAgent:
             )
         return goal
 
-    async def _cleanup_screenshots(self):
-        """Clean up browser and screenshot resources."""
-        for screenshot_file in self._screenshot_files:
+    @asynccontextmanager
+    async def _open_browser(self, headless: bool):
+        """Yield a `(browser, page)` pair, taken from the pool when one is configured."""
+        if self.browser_pool:
+            async with self.browser_pool.session() as (browser, _, page):
+                yield browser, page
+            return
+
+        async with async_playwright() as playwright:
+            playwright, browser, page, teardown = await setup_browser(
+                playwright=playwright,
+                headless=headless,
+            )
             try:
-                if os.path.exists(screenshot_file):
-                    os.remove(screenshot_file)
-            except Exception:
-                pass
-        self._screenshot_files.clear()
+                yield browser, page
+            finally:
+                await teardown()
+
+    def _start_speculative_grounding(
+        self, scheduler, iteration, page, screenshot, subgoal, observation
+    ) -> Optional[str]:
+        """Start grounding the interaction the subgoal most likely refers to.
+
+        Returns the label of the element being grounded, or None when no
+        element matches the subgoal well enough to be worth grounding early.
+        """
+        if not self.speculative_grounding or not screenshot:
+            return None
+        if not isinstance(observation, ScreenOutput):
+            return None
+
+        best, best_score = None, 0.0
+        for interaction in observation.relevant_page_actions:
+            if interaction.type.lower() not in ("click", "button", "link"):
+                continue
+            score = token_overlap(interaction.label, subgoal)
+            if score > best_score:
+                best, best_score = interaction, score
+        if not best or best_score < SPECULATION_MATCH:
+            return None
+
+        scheduler.start(
+            "speculative_ground",
+            self._ground_click(page, screenshot, best.label, iteration),
+            speculative=True,
+        )
+        return best.label
+
+    async def _ground_click(self, page, screenshot, description, iteration) -> GroundingMatch:
+        """Find where to click, from the live DOM when confident and the screenshot otherwise."""
+        if self.dom_grounding_threshold is not None:
+            match = await ground_element(page, description)
+            if match and match.confidence >= self.dom_grounding_threshold:
+                return match
+
+        self._record_image_sent(iteration, screenshot)
+        x, y = await find_coordinates(screenshot, "click " + description)
+        html = page.locator("html")
+        bbox = await html.bounding_box()
+        scroll_y = abs(bbox["y"])
+        # The mouse clicks in the viewport, the indicator dot is drawn on the page
+        return GroundingMatch(
+            x=x, y=y, page_x=x, page_y=y + scroll_y, confidence=0.0, label=description, source="vision"
+        )
+
+    def _reusable_observation(self, page, screenshot) -> Optional[ScreenOutput]:
+        """Get the previous observation if the page has not visibly changed since it was made."""
+        if self.observation_reuse_threshold is None or not screenshot:
+            return None
+        if not self._last_observation:
+            return None
+
+        url, previous, observation = self._last_observation
+        if url != page.url:
+            return None
+        if screenshot.difference(previous) > self.observation_reuse_threshold:
+            return None
+        return observation
+
+    def _observation_stats(self) -> Dict:
+        total = self._observation_hits + self._observation_misses
+        return {
+            "hits": self._observation_hits,
+            "misses": self._observation_misses,
+            "hit_rate": self._observation_hits / total if total else 0.0,
+        }
+
+    async def _scroll(self, page, screenshot, description, direction, iteration):
+        """Scroll the page locally, using vision only to find a named region missing from the DOM."""
+        if is_page_scroll(description):
+            iteration["scroll"] = "local"
+            return await scroll_viewport(page, direction)
+
+        try:
+            result = await scroll_region(page, description, direction)
+        except Exception:
+            result = None
+        if result is not None:
+            iteration["scroll"] = "dom"
+            return result
+
+        iteration["scroll"] = "vision"
+        try:
+            self._record_image_sent(iteration, screenshot)
+            x, y = await find_coordinates(screenshot, "click " + description)
+            return await scroll_page(page, x, y, direction)
+        except Exception as e:
+            return ActionResult(success=False, error=str(e))
+
+    async def _settle(
+        self,
+        page,
+        iteration,
+        scheduler,
+        activity: Optional[PageActivity] = None,
+        min_wait: Optional[float] = None,
+        max_wait: Optional[float] = None,
+    ) -> SettleResult:
+        """Wait for the page to settle after an action and record how long it took."""
+        settle = await scheduler.run(
+            "settle",
+            wait_for_settle(
+                page,
+                min_wait=self.settle_min_seconds if min_wait is None else min_wait,
+                max_wait=self.settle_max_seconds if max_wait is None else max_wait,
+                activity=activity,
+            ),
+        )
+        iteration["settle_seconds"] = settle.seconds
+        iteration["settled"] = settle.settled
+        return settle
+
+    async def _look(self, page, action_goal, text_content, iteration) -> str:
+        """Extract information from the page, reusing an earlier look at the same text for the same goal."""
+        if text_content is None:
+            text_content = await read_page_text(page)
+
+        key = None
+        if self.look_cache:
+            key = look_cache_key(page.url, text_content, action_goal)
+            cached = self.look_cache.get(key)
+            if cached is not None:
+                self._look_hits += 1
+                iteration["look"] = {"cached": True}
+                return cached
+            self._look_misses += 1
+
+        look = await look_at_page(page, action_goal, text_content)
+        iteration["look"] = {**look.stats(), "cached": False}
+        if key:
+            self.look_cache.set(key, look.content)
+        return look.content
+
+    async def _explore(self, page, action, iteration) -> str:
+        """Open the links the action names in background tabs and look at each for the action goal.
+
+        The tabs load and are looked at concurrently, up to
+        `explore_concurrency` at a time, and are closed once read.
+        """
+        # "the first 3 results" asks for 3 links, and the number is not part of what they are about
+        count, query = self.explore_max_tabs, action.param
+        requested = re.search(r"\b(\d{1,2})\b", action.param)
+        if requested and int(requested.group(1)) > 0:
+            count = min(int(requested.group(1)), count)
+            query = action.param[: requested.start()] + action.param[requested.end():]
+        links = rank_links(await collect_links(page), query, count)
+        if not links:
+            return "Found no links to explore on this page"
+
+        slots = asyncio.Semaphore(self.explore_concurrency)
+        started = time.monotonic()
+
+        async def read(link) -> Tuple[str, Dict]:
+            stats = {"url": link.url}
+            async with slots:
+                try:
+                    async with background_tab(page.context, link.url) as tab:
+                        await wait_for_settle(
+                            tab, min_wait=self.settle_min_seconds, max_wait=self.settle_max_seconds
+                        )
+                        finding = await self._look(tab, action.action_goal, None, stats)
+                    stats["success"] = True
+                except Exception as e:
+                    finding = f"could not be read: {str(e)}"
+                    stats["success"] = False
+            return " ".join(finding.split())[:EXPLORE_FINDING_CHARS], stats
+
+        results = await asyncio.gather(*(read(link) for link in links))
+        iteration["explore"] = {
+            "tabs": len(links),
+            "succeeded": sum(1 for _, stats in results if stats["success"]),
+            "duration_seconds": time.monotonic() - started,
+            "pages": [stats for _, stats in results],
+        }
+        lines = [f"Explored {len(links)} pages for: {action.action_goal}"]
+        for number, (link, (finding, _)) in enumerate(zip(links, results), start=1):
+            lines.append(f"{number}. {link.text} ({link.url}): {finding}")
+        return "\n".join(lines)
+
+    def _look_cache_stats(self) -> Dict:
+        total = self._look_hits + self._look_misses
+        return {
+            "hits": self._look_hits,
+            "misses": self._look_misses,
+            "hit_rate": self._look_hits / total if total else 0.0,
+        }
+
+    def _grounding_stats(self) -> Dict:
+        sources = [i["grounding"] for i in self._iterations if "grounding" in i]
+        return {"dom": sources.count("dom"), "vision": sources.count("vision")}
+
+    def _record_image_sent(self, iteration: Dict, screenshot):
+        """Count the bytes of a screenshot sent to a vision model in this iteration."""
+        if screenshot:
+            iteration["screenshot_bytes_sent"] += screenshot.size_bytes
+
+    def _next_screenshot_path(self) -> Optional[str]:
+        """Get the path to save the next screenshot to, if screenshots are kept on disk."""
+        if not self.screenshot_dir:
+            return None
+        self._screenshot_count += 1
+        os.makedirs(self.screenshot_dir, exist_ok=True)
+        return os.path.join(
+            self.screenshot_dir,
+            f"{self._session_id}-{self._screenshot_count:04d}.{self.screenshot_encoding.extension}",
+        )
 
     async def run(
         self,
@@ -281,55 +811,240 @@ class WebAgent:
         status_callback: Optional[Callable[[str, str], None]] = None,
         session_id: Optional[str] = None,
         max_iterations: Optional[int] = None,
+        priority: int = 0,
+        tenant: Optional[str] = None,
     ) -> Dict:
         """Execute an AI-guided web navigation session.
 
         Args:
             goal: The goal to accomplish
             secrets: Optional secrets/credentials needed for the task
-            headless: Whether to run the browser in headless mode
+            headless: Whether to run the browser in headless mode (ignored when a browser pool is used)
             response_schema: Optional schema for structuring the response
             status_callback: Optional callback for status updates
             session_id: Optional session identifier
             max_iterations: Optional maximum number of iterations (overrides class-level setting)
+            priority: Queue priority when a scheduler is used, lower numbers start first
+            tenant: Who the run is for, so a scheduler shares run slots fairly between tenants
+        """
+        # Cleared before queueing, so a stop requested while the run waits for a slot is kept
+        self._stop_event.clear()
+        # Initialize status tracking
+        self._status_manager = StatusManager(status_callback, history_size=self.status_history)
+        if not self.scheduler:
+            return await self._run(
+                goal, secrets, headless, response_schema, session_id, max_iterations
+            )
+
+        if not self.scheduler.has_capacity():
+            self._status_manager.update(
+                "queued", f"Waiting for a run slot, {self.scheduler.queued} runs already queued"
+            )
+        status_manager = self._status_manager
+        queued_at = time.monotonic()
+        try:
+            async with self.scheduler.slot(tenant, priority) as ticket:
+                if self._stop_event.is_set():
+                    # Stopped while queued, so the run ends before opening a browser
+                    status_manager.update("stopped", "Navigation stopped by user")
+                    run_result = {
+                        "result": "Navigation stopped by user",
+                        "trajectory": [{"action": "stopped", "result": "Navigation stopped by user"}],
+                        "trajectory_steps": 0,
+                        "duration_seconds": time.monotonic() - queued_at,
+                        "iterations": [],
+                    }
+                else:
+                    run_result = await self._run(
+                        goal, secrets, headless, response_schema, session_id, max_iterations
+                    )
+        finally:
+            # A run refused or cancelled while queued never reaches the cleanup of _run
+            await status_manager.aclose()
+        run_result["admission"] = ticket.to_dict()
+        return run_result
+
+    async def run_many(
+        self,
+        goals: Iterable[Union[str, BatchGoal]],
+        concurrency: int = 4,
+        response_schema: Optional[Dict] = None,
+        timeout_seconds: Optional[float] = None,
+        headless: bool = True,
+    ) -> AsyncIterator[Dict]:
+        """Run many goals, up to `concurrency` at a time, and yield each result as it finishes.
+
+        Each run gets its own agent with this agent's configuration, so
+        browsers, caches, macros and the scheduler are shared across the
+        batch. Without a browser pool, one of `concurrency` browsers is
+        started for the batch. Goals are read lazily, so `goals` may be a
+        generator of any length.
+
+        Args:
+            goals: Goals as text, or as BatchGoal for a per-goal schema, timeout or priority
+            concurrency: Maximum number of runs in progress at once
+            response_schema: Schema for the goals that don't set their own
+            timeout_seconds: Time limit of each run, for the goals that don't set their own
+            headless: Whether to run the batch's browsers in headless mode
+
+        Yields:
+            The run result with the `index` and `goal` of the run, or `index`,
+            `goal` and `error` when the run failed or timed out.
         """
+        pool = self.browser_pool
+        own_pool = pool is None
+        if own_pool:
+            pool = BrowserPool(size=concurrency, headless=headless)
+            await pool.start()
 
+        pending = iter(enumerate(goals))
+        results: asyncio.Queue = asyncio.Queue()
+        # An error raised by the goals themselves, re-raised once the runs in progress are done
+        failures: List[BaseException] = []
+
+        async def worker():
+            try:
+                while not self._stop_event.is_set():
+                    try:
+                        index, goal = next(pending)
+                    except StopIteration:
+                        return
+                    except Exception as e:
+                        failures.append(e)
+                        return
+                    results.put_nowait(
+                        await self._run_batch_goal(index, goal, pool, response_schema, timeout_seconds)
+                    )
+            finally:
+                # None marks the end of one worker
+                results.put_nowait(None)
+
+        self._stop_event.clear()
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            remaining = len(workers)
+            while remaining:
+                result = await results.get()
+                if result is None:
+                    remaining -= 1
+                else:
+                    yield result
+            if failures:
+                raise failures[0]
+        finally:
+            # Runs still in progress when the caller stops iterating are cancelled
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if own_pool:
+                await pool.close()
+
+    async def _run_batch_goal(
+        self,
+        index: int,
+        goal: Union[str, BatchGoal],
+        pool: BrowserPool,
+        response_schema: Optional[Dict],
+        timeout_seconds: Optional[float],
+    ) -> Dict:
+        if isinstance(goal, str):
+            goal = BatchGoal(goal)
+        # A shallow copy shares the configuration, and each run resets its own state
+        agent = copy.copy(self)
+        agent.browser_pool = pool
+        agent._stop_event = Event()
+        agent._batch_agents = []
+        self._batch_agents.append(agent)
+
+        timeout = goal.timeout_seconds if goal.timeout_seconds is not None else timeout_seconds
+        started = time.monotonic()
+        try:
+            run_result = await asyncio.wait_for(
+                agent.run(
+                    goal.goal,
+                    secrets=goal.secrets,
+                    response_schema=goal.response_schema or response_schema,
+                    session_id=goal.session_id,
+                    max_iterations=goal.max_iterations,
+                    priority=goal.priority,
+                    tenant=goal.tenant,
+                ),
+                timeout,
+            )
+            return {"index": index, "goal": goal.goal, **run_result}
+        except asyncio.TimeoutError:
+            error = f"Timed out after {timeout} seconds"
+        except Exception as e:
+            error = str(e)
+        finally:
+            self._batch_agents.remove(agent)
+        return {
+            "index": index,
+            "goal": goal.goal,
+            "error": error,
+            "duration_seconds": time.monotonic() - started,
+        }
+
+    async def _run(
+        self,
+        goal: str,
+        secrets: Optional[str],
+        headless: bool,
+        response_schema: Optional[Dict],
+        session_id: Optional[str],
+        max_iterations: Optional[int],
+    ) -> Dict:
         if not session_id:
             session_id = str(uuid.uuid4())
+        self._session_id = session_id
+        self._screenshot_count = 0
+        self._iterations = []
+        self._last_observation = None
+        self._observation_hits = 0
+        self._observation_misses = 0
+        self._look_hits = 0
+        self._look_misses = 0
+        self._performed = []
+        self._click_dot_drawn = False
 
         # Use run-specific max_iterations if provided, otherwise use class-level setting
         iterations_limit = max_iterations if max_iterations is not None else self.max_iterations
 
-        start_time = time.time()
-        self._stop_event.clear()
+        start_time = time.monotonic()
+        self._start_warm_up()
 
-        # Initialize status tracking
-        self._status_manager = StatusManager(status_callback)
         self._status_manager.update("starting", f"{goal}")
 
         # Prepare the complete goal
+        macro_goal = goal
         goal = self._prepare_goal(goal, secrets, response_schema)
 
         # Initialize trajectory and completed result
-        trajectory = []
+        trajectory = Trajectory(
+            window=self.trajectory_window,
+            summarize=summarize_steps if self.summarize_trajectory else None,
+            # Recorded calls replay only if their inputs don't depend on the summarizer's timing
+            inline=calls_replayable(),
+        )
         completed_result = None
 
-        with opper.traces.start(name="run") as run_span:
-            run_span.update(input=goal)
+        async with start_trace("run") as run_span:
+            await run_span.update(input=goal)
 
             # Setup browser session
             self._status_manager.update("setup", "Initializing browser")
-            async with async_playwright() as playwright:
-                playwright, browser, page, teardown = await setup_browser(
-                    playwright=playwright,
-                    headless=headless,
-                )
+            browser_started = time.monotonic()
+            async with self._open_browser(headless) as (browser, page):
+                routing = await install_routing(page.context, self.routing_profile)
+                browser_setup_seconds = time.monotonic() - browser_started
                 trajectory.append(
                     {"action": "setup", "result": "Opened up an empty browser window"}
                 )
 
                 # Execute navigation loop
                 try:
+                    macro = await self._replay_macro(page, macro_goal, trajectory)
+                    finished = False
                     iteration_count = 0
                     while not self._stop_event.is_set():
                         if iteration_count >= iterations_limit:
@@ -343,8 +1058,9 @@ class WebAgent:
                         iteration_count += 1
                     
                         if status in ["finished", "break"]:
+                            finished = status == "finished"
                             completed_result = result
-                            run_span.update(output=str(completed_result))
+                            await run_span.update(output=str(completed_result))
                             break
 
                     # Handle stopped state
@@ -352,11 +1068,30 @@ class WebAgent:
                         completed_result = "Navigation stopped by user"
                         trajectory.append({"action": "stopped", "result": completed_result})
                     
-                    return {
+                    # Keep the path to the goal, unless it may involve typing secrets
+                    if finished and self.macros and not secrets:
+                        macro["saved"] = self.macros.save(macro_goal, self._performed)
+
+                    await trajectory.aclose()
+                    run_result = {
                         "result": completed_result,
-                        "trajectory": trajectory,
-                        "duration_seconds": time.time() - start_time,
+                        "trajectory": trajectory.to_list(),
+                        "trajectory_steps": trajectory.total_steps,
+                        "duration_seconds": time.monotonic() - start_time,
+                        "iterations": self._iterations,
+                        "observation_reuse": self._observation_stats(),
+                        "grounding": self._grounding_stats(),
+                        "look_cache": self._look_cache_stats(),
+                        "routing": routing.to_dict(),
+                        "macro": macro,
+                        "timing": {
+                            "browser_setup_seconds": browser_setup_seconds,
+                            **summarize_iterations(self._iterations),
+                        },
                     }
+                    if self.browser_pool:
+                        run_result["browser_pool"] = self.browser_pool.stats()
+                    return run_result
 
                 except Exception as e:
                     self._status_manager.update("error", str(e))
@@ -366,7 +1101,5 @@ class WebAgent:
                     self._status_manager.update(
                         "cleanup", "Done with task, closing browser"
                     )
-                    await teardown()
-                    await self._cleanup_screenshots()
-
-
+                    # Observers get every update of the run before it returns
+                    await self._status_manager.aclose()
@@ -3,9 +3,9 @@ from typing import Literal, Tuple
 
 class Action(BaseModel):
     thoughts: str
-    action: Literal["navigate", "click", "type", "scroll_down", "scroll_up", "look", "wait", "finished"]
+    action: Literal["navigate", "click", "type", "scroll_down", "scroll_up", "look", "explore", "wait", "finished"]
     action_goal: str
-    param: str = Field(description="The parameter for the action (e.g. URL for navigate, text for type, visual element description for click)")
+    param: str = Field(description="The parameter for the action (e.g. URL for navigate, text for type, visual element description for click, the links to open for explore)")
 
 class ActionResult(BaseModel):
     success: bool
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Set
+
+
+class StageScheduler:
+    """Runs the stages of one agent iteration, overlapping those that are independent.
+
+    Stages are started as tasks and awaited by name when their result is
+    needed. Speculative stages are cancelled when the iteration ends without
+    anyone asking for their result. The wall time of every stage is kept in
+    `durations`.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._speculative: Set[str] = set()
+        self.cancelled: Set[str] = set()
+
+    def start(self, name: str, coro: Awaitable, speculative: bool = False) -> asyncio.Task:
+        """Start a stage in the background."""
+        task = asyncio.create_task(self._timed(name, coro))
+        self._tasks[name] = task
+        if speculative:
+            self._speculative.add(name)
+        return task
+
+    async def run(self, name: str, coro: Awaitable) -> Any:
+        """Run a stage to completion."""
+        self.start(name, coro)
+        return await self.result(name)
+
+    def has(self, name: str) -> bool:
+        return name in self._tasks and name not in self.cancelled
+
+    async def result(self, name: str) -> Any:
+        """Wait for a started stage and return its result."""
+        self._speculative.discard(name)
+        return await self._tasks[name]
+
+    def cancel(self, name: str):
+        """Cancel a stage whose result turned out not to be needed."""
+        task = self._tasks.get(name)
+        if task and not task.done():
+            task.cancel()
+            self.cancelled.add(name)
+        self._speculative.discard(name)
+
+    async def close(self):
+        """Cancel speculative stages nobody used and wait for everything to finish."""
+        for name in list(self._speculative):
+            self.cancel(name)
+        pending = [task for task in self._tasks.values() if not task.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        for name, task in self._tasks.items():
+            if name not in self.cancelled and not task.cancelled() and task.exception():
+                logging.debug(f"Stage {name} failed: {task.exception()}")
+
+    async def _timed(self, name: str, coro: Awaitable) -> Any:
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            self.durations[name] = time.monotonic() - started
@@ -1,7 +1,17 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from threading import Lock
-from typing import Callable, List, Optional
+from typing import AsyncIterator, Callable, List, Optional, Set
+
+from .browser.screenshot import Screenshot
 
 
 @dataclass
@@ -9,33 +19,90 @@ class StatusEntry:
     timestamp: datetime
     action: str
     details: str = None
-    screenshot_path: Optional[str] = None
+    screenshot: Optional[Screenshot] = None
+    # Seconds since the status manager was created, and since the previous update
+    elapsed_seconds: float = 0.0
+    step_seconds: float = 0.0
+    # Increases by one with every update, used as a cursor into the history
+    sequence: int = 0
+
+
+class Subscription:
+    """A bounded buffer of updates for one subscriber, with an event set when updates arrive."""
+
+    def __init__(self, buffer: int):
+        self.items: deque = deque(maxlen=buffer)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, item):
+        # A full buffer drops its oldest item, so a slow subscriber skips ahead instead of blocking the publisher
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append(item)
+        self.ready.set()
 
 
 class StatusManager:
+    """Keeps the latest status updates of a run and hands them to observers without waiting on them.
+
+    The last `history_size` updates are kept in a ring buffer. The callback
+    is called in order from a background task, sync callbacks in a thread
+    of the manager's own, so a slow callback never holds up the agent or
+    takes threads from the event loop's default executor; when it falls more
+    than `callback_buffer` updates behind, the oldest are skipped. Async
+    subscribers each get a queue of `subscriber_buffer` updates.
+    """
+
     def __init__(
         self,
-        status_callback: Optional[Callable[[str, str, Optional[str]], None]] = None,
+        status_callback: Optional[
+            Callable[[str, str, Optional[Screenshot]], None]
+        ] = None,
+        history_size: Optional[int] = None,
+        subscriber_buffer: int = 64,
+        callback_buffer: int = 1024,
     ):
         self._status_lock = Lock()
-        self._status_log: List[StatusEntry] = []
+        self._status_log: deque = deque(
+            maxlen=history_size or int(os.getenv("WEBAGENT_STATUS_HISTORY", "256"))
+        )
+        self._sequence = itertools.count(1)
         self._status_callback = status_callback
+        self._started = time.monotonic()
+        self._last_update = self._started
+
+        self._subscriber_buffer = subscriber_buffer
+        self._subscribers: Set[Subscription] = set()
+        self._pending: deque = deque(maxlen=callback_buffer)
+        self._pending_ready: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._callback_thread: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+        self.dropped_callbacks = 0
 
     def update(
-        self, action: str, details: str = None, screenshot_path: Optional[str] = None
+        self, action: str, details: str = None, screenshot: Optional[Screenshot] = None
     ):
         """Update the current status of the web agent."""
         with self._status_lock:
-            self._status_log.append(
-                StatusEntry(
-                    timestamp=datetime.now(),
-                    action=action,
-                    details=details,
-                    screenshot_path=screenshot_path,
-                )
+            now = time.monotonic()
+            entry = StatusEntry(
+                timestamp=datetime.now(),
+                action=action,
+                details=details,
+                screenshot=screenshot,
+                elapsed_seconds=now - self._started,
+                step_seconds=now - self._last_update,
+                sequence=next(self._sequence),
             )
+            self._status_log.append(entry)
+            self._last_update = now
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(entry)
         if self._status_callback:
-            self._status_callback(action, details, screenshot_path)
+            self._dispatch(entry)
 
     def get_current(self) -> dict:
         """Get the current status of the web agent."""
@@ -45,11 +112,98 @@ class StatusManager:
                 return {
                     "action": latest.action,
                     "details": latest.details,
-                    "screenshot_path": latest.screenshot_path,
+                    "screenshot": latest.screenshot,
+                    "elapsed_seconds": latest.elapsed_seconds,
+                    "sequence": latest.sequence,
                 }
-            return {"action": None, "details": None, "screenshot_path": None}
+            return {
+                "action": None,
+                "details": None,
+                "screenshot": None,
+                "elapsed_seconds": 0.0,
+                "sequence": 0,
+            }
 
-    def get_history(self) -> List[StatusEntry]:
-        """Get the full history of status updates."""
+    def get_history(
+        self, cursor: Optional[int] = None, limit: Optional[int] = None
+    ) -> List[StatusEntry]:
+        """Get the retained status updates after the `cursor` sequence, at most `limit` of them.
+
+        Pass the `sequence` of the last entry returned as the next cursor to
+        page through the history.
+        """
+        with self._status_lock:
+            entries = [e for e in self._status_log if cursor is None or e.sequence > cursor]
+        return entries[:limit] if limit is not None else entries
+
+    async def subscribe(self, cursor: Optional[int] = None) -> AsyncIterator[StatusEntry]:
+        """Yield the retained updates after `cursor`, then new updates until the manager is closed."""
+        subscription = Subscription(self._subscriber_buffer)
         with self._status_lock:
-            return self._status_log.copy()
+            for entry in self._status_log:
+                if cursor is None or entry.sequence > cursor:
+                    subscription.push(entry)
+            self._subscribers.add(subscription)
+        try:
+            while True:
+                while subscription.items:
+                    yield subscription.items.popleft()
+                if self._closed:
+                    return
+                subscription.ready.clear()
+                await subscription.ready.wait()
+        finally:
+            self._subscribers.discard(subscription)
+
+    async def aclose(self):
+        """End subscriptions and wait for the callback to receive every pending update."""
+        self._closed = True
+        for subscription in list(self._subscribers):
+            subscription.ready.set()
+        if self._dispatcher is not None:
+            self._pending_ready.set()
+            await self._dispatcher
+            self._dispatcher = None
+        if self._callback_thread is not None:
+            self._callback_thread.shutdown(wait=False)
+            self._callback_thread = None
+
+    def _dispatch(self, entry: StatusEntry):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Without an event loop there is nothing to hand the call to
+            self._call(entry)
+            return
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped_callbacks += 1
+        self._pending.append(entry)
+        if self._dispatcher is None:
+            self._pending_ready = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._deliver())
+        self._pending_ready.set()
+
+    async def _deliver(self):
+        while True:
+            while self._pending:
+                entry = self._pending.popleft()
+                try:
+                    if inspect.iscoroutinefunction(self._status_callback):
+                        await self._status_callback(entry.action, entry.details, entry.screenshot)
+                    else:
+                        if self._callback_thread is None:
+                            self._callback_thread = ThreadPoolExecutor(
+                                max_workers=1, thread_name_prefix="webagent-status"
+                            )
+                        await asyncio.get_running_loop().run_in_executor(
+                            self._callback_thread, self._call, entry
+                        )
+                except Exception as e:
+                    logging.error(f"Status callback failed: {str(e)}")
+            if self._closed:
+                return
+            self._pending_ready.clear()
+            await self._pending_ready.wait()
+
+    def _call(self, entry: StatusEntry):
+        self._status_callback(entry.action, entry.details, entry.screenshot)
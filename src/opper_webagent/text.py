@@ -0,0 +1,94 @@
+import math
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning when matching element descriptions
+STOPWORDS = {
+    "a", "an", "the", "on", "in", "at", "to", "of", "for", "and", "or", "with",
+    "click", "button", "link", "field", "this", "that", "it", "is", "page",
+}
+
+
+def tokenize(text: str, drop_stopwords: bool = True) -> List[str]:
+    """Split text into lowercase word tokens."""
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    if drop_stopwords:
+        tokens = [t for t in tokens if t not in STOPWORDS]
+    return tokens
+
+
+def token_overlap(query: str, candidate: str) -> float:
+    """Get the fraction of the query's tokens that appear in the candidate (0.0 - 1.0)."""
+    query_tokens = set(tokenize(query))
+    if not query_tokens:
+        return 0.0
+    return len(query_tokens & set(tokenize(candidate))) / len(query_tokens)
+
+
+def mutual_overlap(text: str, other: str) -> float:
+    """Get the token overlap of two texts in whichever direction is lower, so extra words on either side count."""
+    return min(token_overlap(text, other), token_overlap(other, text))
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate how many model tokens a text takes up (about four characters each)."""
+    return (len(text or "") + 3) // 4
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most `max_chars`, breaking between lines where possible."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # Lines longer than a chunk are split on their own
+        while len(line) > max_chars:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) + 1 > max_chars and current:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def bm25_scores(
+    query: str, documents: List[str], k1: float = 1.5, b: float = 0.75
+) -> List[float]:
+    """Score how relevant each document is to a query with Okapi BM25."""
+    query_tokens = set(tokenize(query))
+    docs = [tokenize(doc) for doc in documents]
+    if not query_tokens or not docs:
+        return [0.0] * len(documents)
+
+    average_length = sum(len(doc) for doc in docs) / len(docs) or 1.0
+    document_frequency = dict.fromkeys(query_tokens, 0)
+    for doc in docs:
+        for token in query_tokens.intersection(doc):
+            document_frequency[token] += 1
+    scores = []
+    for doc in docs:
+        counts = {}
+        for token in doc:
+            if token in query_tokens:
+                counts[token] = counts.get(token, 0) + 1
+        score = 0.0
+        for token, count in counts.items():
+            df = document_frequency[token]
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * count * (k1 + 1) / (
+                count + k1 * (1 - b + b * len(doc) / average_length)
+            )
+        scores.append(score)
+    return scores
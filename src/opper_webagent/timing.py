@@ -0,0 +1,43 @@
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get a percentile of some values by linear interpolation, or 0.0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_durations(values: List[float]) -> Dict[str, float]:
+    """Summarize durations in seconds by count, total, p50, p95 and max."""
+    return {
+        "count": len(values),
+        "total": sum(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": max(values, default=0.0),
+    }
+
+
+def summarize_iterations(iterations: Iterable[Dict]) -> Dict:
+    """Aggregate the iteration and per-stage timings of a run.
+
+    Stages that overlap within an iteration are each counted in full, so
+    stage totals can add up to more than the iteration durations.
+    """
+    durations = []
+    stages: Dict[str, List[float]] = {}
+    for iteration in iterations:
+        if "duration_seconds" in iteration:
+            durations.append(iteration["duration_seconds"])
+        for stage, seconds in iteration.get("stage_seconds", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "iteration": summarize_durations(durations),
+        "stages": {stage: summarize_durations(values) for stage, values in sorted(stages.items())},
+    }
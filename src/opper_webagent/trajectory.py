@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+# How many steps to keep in full before older ones are rolled into the summary
+DEFAULT_WINDOW = 20
+
+# How many steps to collect before summarizing them, so the summarizer is not called every step
+SUMMARY_BATCH = 5
+
+# Upper bound on the summary kept when it is compacted locally
+MAX_SUMMARY_CHARS = 4000
+
+# How much of each step's result to keep when compacting locally
+STEP_RESULT_CHARS = 160
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+def describe_step(step: Dict, result_chars: Optional[int] = STEP_RESULT_CHARS) -> str:
+    """Describe a trajectory step on one line."""
+    action = step.get("action", "step")
+    if step.get("param"):
+        action += f"({step['param']})"
+    result = " ".join(str(step.get("result", "")).split())
+    if result_chars is not None and len(result) > result_chars:
+        result = result[: result_chars - 3] + "..."
+    return f"{action}: {result}" if result else action
+
+
+def compact_locally(summary: str, steps: List[Dict]) -> str:
+    """Roll steps into a summary without a model, keeping the most recent text within bounds."""
+    lines = [summary] if summary else []
+    lines += [describe_step(step) for step in steps]
+    text = "\n".join(lines)
+    if len(text) > MAX_SUMMARY_CHARS:
+        text = "..." + text[-(MAX_SUMMARY_CHARS - 3):]
+    return text
+
+
+class Trajectory:
+    """The steps taken during a run, with a bounded window of recent steps kept in full.
+
+    Steps pushed out of the window are rolled into a running summary, by the
+    `summarize` coroutine in the background when one is given, so that the
+    models see the whole run in a fixed budget. Until a batch of steps has
+    been summarized, it is compacted locally when read.
+
+    With `inline`, nothing is summarized in the background; batches are
+    summarized when `catch_up` is awaited, so what the models see does not
+    depend on how fast the summarizer was.
+    """
+
+    def __init__(
+        self,
+        window: int = DEFAULT_WINDOW,
+        summarize: Optional[Summarizer] = None,
+        inline: bool = False,
+    ):
+        self.window = max(window, 1)
+        self.summary = ""
+        self.total_steps = 0
+        self.inline = inline
+        self._summarize = summarize
+        self._steps: deque = deque()
+        self._pending: List[Dict] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def append(self, step: Dict):
+        """Add a step, rolling the oldest step out of the window if it is full."""
+        self._steps.append(step)
+        self.total_steps += 1
+        if len(self._steps) > self.window:
+            self._pending.append(self._steps.popleft())
+            self._compact()
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._steps)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return list(self._steps)[index]
+        return self._steps[index]
+
+    @property
+    def summarized_steps(self) -> int:
+        """How many steps are only part of the summary."""
+        return self.total_steps - len(self._steps)
+
+    def current_summary(self) -> str:
+        """Get the summary of the steps outside the window, including those not yet summarized."""
+        if not self._pending:
+            return self.summary
+        return compact_locally(self.summary, self._pending)
+
+    def for_model(self, recent: int) -> List[Dict]:
+        """Get the last `recent` steps, preceded by a summary of everything before them."""
+        steps = list(self._steps)
+        older = []
+        if len(steps) > recent:
+            split = len(steps) - recent
+            older, steps = steps[:split], steps[split:]
+        summary = self.current_summary()
+        if older:
+            summary = compact_locally(summary, older)
+        if not summary:
+            return steps
+        return [{"action": "summary", "result": summary}] + steps
+
+    def to_list(self) -> List[Dict]:
+        """Serialize the trajectory as the summary followed by the steps in the window."""
+        summary = self.current_summary()
+        if not summary:
+            return list(self._steps)
+        return [
+            {"action": "summary", "steps": self.summarized_steps, "result": summary}
+        ] + list(self._steps)
+
+    async def catch_up(self):
+        """Summarize the batches of steps waiting for it, when summaries are made inline."""
+        if self.inline and self._summarize is not None and len(self._pending) >= SUMMARY_BATCH:
+            await self._summarize_batch(self._pending[:])
+
+    async def aclose(self):
+        """Wait for a summary in progress, so that `summary` is final."""
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _compact(self):
+        if self._task and not self._task.done():
+            return
+        if self._summarize is None:
+            self.summary = compact_locally(self.summary, self._pending)
+            self._pending = []
+            return
+        if self.inline or len(self._pending) < SUMMARY_BATCH:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.summary = compact_locally(self.summary, self._pending)
+            self._pending = []
+            return
+
+        batch = self._pending[:]
+        self._task = loop.create_task(self._summarize_batch(batch))
+
+    async def _summarize_batch(self, batch: List[Dict]):
+        try:
+            summary = await self._summarize(self.summary, batch)
+        except Exception as e:
+            logging.warning(f"Failed to summarize trajectory: {str(e)}")
+            summary = compact_locally(self.summary, batch)
+        self.summary = summary
+        self._pending = self._pending[len(batch):]
+
+
+def recent_steps(trajectory: Union[Trajectory, Sequence[Dict]], count: int) -> List[Dict]:
+    """Get the last `count` steps of a trajectory, with a summary of the rest if it has one."""
+    if isinstance(trajectory, Trajectory):
+        return trajectory.for_model(count)
+    return list(trajectory[-count:])